@@ -0,0 +1,86 @@
+"""
+Compares the BMesh and the array (foreach_set) mesh building paths of the importer on a synthetic NUD mesh.
+
+Run it from the repository root with blender in background mode:
+    blender -b --factory-startup -P benchmarks/mesh_build.py -- [vertex count]
+"""
+
+import importlib
+import os
+import sys
+import time
+
+import bpy
+import numpy as np
+
+# Import the add-on package from the repository directory
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(REPO_DIR))
+addon = importlib.import_module(os.path.basename(REPO_DIR))
+
+NudMesh = importlib.import_module(f'{addon.__name__}.xfbin_lib.xfbin.structure.nud').NudMesh
+NudVertex = importlib.import_module(f'{addon.__name__}.xfbin_lib.xfbin.structure.nud').NudVertex
+importer = importlib.import_module(f'{addon.__name__}.blender.importer')
+nud_arrays = importlib.import_module(f'{addon.__name__}.blender.common.nud_arrays')
+
+
+def make_grid_nud_mesh(vertex_count: int) -> NudMesh:
+    """Creates a square grid NudMesh with colors and 2 UV channels."""
+
+    side = int(vertex_count ** 0.5)
+    rng = np.random.default_rng(0)
+
+    mesh = NudMesh()
+    mesh.vertices = list()
+    for y in range(side):
+        for x in range(side):
+            v = NudVertex()
+            v.position = (x * 1.0, y * 1.0, 0.0)
+            v.normal = (0.0, 0.0, 1.0)
+            v.tangent = (1.0, 0.0, 0.0)
+            v.bitangent = (0.0, 1.0, 0.0)
+            v.color = tuple(int(c) for c in rng.integers(0, 256, 4))
+            v.uv = [(x / side, y / side), (y / side, x / side)]
+            # Weights are applied to the object after building the mesh, so they are not measured here
+            v.bone_ids = tuple()
+            v.bone_weights = tuple()
+            mesh.vertices.append(v)
+
+    mesh.faces = list()
+    for y in range(side - 1):
+        for x in range(side - 1):
+            i = y * side + x
+            mesh.faces.append((i, i + 1, i + side))
+            mesh.faces.append((i + 1, i + side + 1, i + side))
+
+    return mesh
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    vertex_count = int(argv[0]) if argv else 200_000
+
+    nud_mesh = make_grid_nud_mesh(vertex_count)
+    print(f'Synthetic NUD mesh: {len(nud_mesh.vertices)} vertices, {len(nud_mesh.faces)} faces')
+
+    xfbin_importer = importer.XfbinImporter(None, '', dict())
+
+    start = time.perf_counter()
+    bm = xfbin_importer.nud_mesh_to_bmesh(nud_mesh, list())
+    bm.to_mesh(bpy.data.meshes.new('bmesh'))
+    bm.free()
+    bmesh_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    arrays = nud_arrays.NudMeshArrays(nud_mesh)
+    arrays_time = time.perf_counter() - start
+    xfbin_importer.nud_mesh_to_mesh(arrays, bpy.data.meshes.new('arrays'))
+    fast_time = time.perf_counter() - start
+
+    print(f'BMesh:  {bmesh_time:.3f}s')
+    print(f'Arrays: {fast_time:.3f}s ({arrays_time:.3f}s of which converting the NUD mesh to arrays)')
+    print(f'Speedup: {bmesh_time / fast_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
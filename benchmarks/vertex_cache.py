@@ -0,0 +1,57 @@
+"""
+Measures the vertex cache optimization stage of the exporter on a synthetic grid mesh with shuffled faces.
+
+Run it from the repository root with python (blender is not needed):
+    python benchmarks/vertex_cache.py [face count]
+"""
+
+import importlib
+import os
+import sys
+import time
+
+import numpy as np
+
+# Import the vertex cache module from the repository directory, without the blender-dependent package modules
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, 'blender', 'common'))
+vertex_cache = importlib.import_module('vertex_cache')
+
+
+def make_grid_faces(face_count: int) -> np.ndarray:
+    """Creates the triangles of a square grid, in a random order and with randomly numbered vertices."""
+
+    side = int((face_count / 2) ** 0.5) + 1
+    rng = np.random.default_rng(0)
+
+    grid = np.arange(side * side, dtype=np.int32).reshape(side, side)
+    a, b = grid[:-1, :-1].ravel(), grid[:-1, 1:].ravel()
+    c, d = grid[1:, :-1].ravel(), grid[1:, 1:].ravel()
+    faces = np.concatenate((np.stack((a, b, c), axis=1), np.stack((b, d, c), axis=1)))
+
+    faces = faces[rng.permutation(len(faces))]
+    return rng.permutation(side * side).astype(np.int32)[faces]
+
+
+def main():
+    argv = sys.argv[1:]
+    face_count = int(argv[0]) if argv else 50000
+
+    faces = make_grid_faces(face_count)
+    vertex_count = int(faces.max()) + 1
+    print(f'{len(faces)} faces, {vertex_count} vertices')
+
+    acmr, atvr = vertex_cache.acmr_atvr(faces, vertex_count)
+    print(f'Before: ACMR {acmr:.3f}, ATVR {atvr:.3f}')
+
+    start = time.perf_counter()
+    order = vertex_cache.optimize_vertex_cache(faces, vertex_count)
+    _, optimized = vertex_cache.reorder_vertices(faces[order])
+    elapsed = time.perf_counter() - start
+
+    acmr, atvr = vertex_cache.acmr_atvr(optimized, vertex_count)
+    print(f'After: ACMR {acmr:.3f}, ATVR {atvr:.3f} ({elapsed:.2f} s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+from typing import List, Tuple
+
+import numpy as np
+
+from ...xfbin_lib.xfbin.structure.nucc import CoordNode
+
+
+def sort_coord_nodes(root_nodes: List[CoordNode]) -> Tuple[List[CoordNode], np.ndarray]:
+    """Flattens the node hierarchies into a list where every parent comes before its children,
+    in the same depth-first order as a recursive traversal. Does not recurse, so deep hierarchies are not a problem.
+    Returns the nodes, and the index of each node's parent in the list (-1 for roots)."""
+
+    nodes = list()
+    parents = list()
+
+    stack = [(root, -1) for root in reversed(root_nodes)]
+    while stack:
+        node, parent = stack.pop()
+
+        index = len(nodes)
+        nodes.append(node)
+        parents.append(parent)
+
+        # Reversed, so that the first child is visited first
+        stack.extend((child, index) for child in reversed(node.children))
+
+    return nodes, np.array(parents, dtype=np.int32)
+
+
+def euler_zyx_to_matrices(rotations: np.ndarray) -> np.ndarray:
+    """Converts (count, 3) euler angles in radians to (count, 3, 3) rotation matrices, like mathutils.Euler with the 'ZYX' order."""
+
+    sx, sy, sz = np.sin(rotations).T
+    cx, cy, cz = np.cos(rotations).T
+
+    # Rx @ Ry @ Rz
+    matrices = np.empty((len(rotations), 3, 3), dtype=np.float64)
+    matrices[:, 0, 0] = cy * cz
+    matrices[:, 0, 1] = -cy * sz
+    matrices[:, 0, 2] = sy
+    matrices[:, 1, 0] = sx * sy * cz + cx * sz
+    matrices[:, 1, 1] = -sx * sy * sz + cx * cz
+    matrices[:, 1, 2] = -sx * cy
+    matrices[:, 2, 0] = -cx * sy * cz + sx * sz
+    matrices[:, 2, 1] = cx * sy * sz + sx * cz
+    matrices[:, 2, 2] = cx * cy
+
+    return matrices
+
+
+def node_local_matrices(nodes: List[CoordNode]) -> np.ndarray:
+    """Builds the (count, 4, 4) local matrices of the nodes in blender's units: translation @ rotation @ absolute scale."""
+
+    count = len(nodes)
+    positions = np.array([n.position for n in nodes], dtype=np.float64).reshape(count, 3) * 0.01
+    rotations = np.radians(np.array([n.rotation for n in nodes], dtype=np.float64).reshape(count, 3))
+    scales = np.abs(np.array([n.scale for n in nodes], dtype=np.float64).reshape(count, 3))
+
+    matrices = np.zeros((count, 4, 4), dtype=np.float64)
+    matrices[:, :3, :3] = euler_zyx_to_matrices(rotations) * scales[:, None, :]
+    matrices[:, :3, 3] = positions
+    matrices[:, 3, 3] = 1
+
+    return matrices
+
+
+def node_world_matrices(local_matrices: np.ndarray, parents: np.ndarray) -> np.ndarray:
+    """Multiplies the local matrices by their parents' world matrices. The nodes must be sorted with sort_coord_nodes.
+    All nodes of the same depth are multiplied together, so this only loops once per hierarchy level."""
+
+    count = len(parents)
+    world = local_matrices.copy()
+
+    depths = np.zeros(count, dtype=np.int32)
+    for i in range(count):
+        if parents[i] >= 0:
+            depths[i] = depths[parents[i]] + 1
+
+    for depth in range(1, int(depths.max(initial=0)) + 1):
+        level = np.flatnonzero(depths == depth)
+        world[level] = world[parents[level]] @ local_matrices[level]
+
+    return world
@@ -0,0 +1,65 @@
+from typing import Tuple
+
+import numpy as np
+
+# Ritter's growth step converges in a few iterations, this only bounds degenerate cases
+MAX_RITTER_ITERATIONS = 64
+
+
+def enclosing_radius(points: np.ndarray, center: np.ndarray) -> float:
+    """Returns the distance from the center to the farthest point."""
+    return float(np.sqrt(((points - center) ** 2).sum(axis=1).max(initial=0)))
+
+
+def ritter_sphere(points: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Computes a tight bounding sphere of (count, 3) points with Ritter's algorithm.
+
+    The initial sphere spans two far apart points. Instead of growing it over every point in sequence,
+    it is grown towards the farthest point outside of it, which only needs a vectorized pass over the points
+    per iteration. The smaller of this sphere and the one around the bounding box's center is returned.
+    Returns the center and the radius. An empty array gives a zero sphere."""
+
+    if len(points) == 0:
+        return np.zeros(3, dtype=np.float64), 0.0
+
+    points = np.asarray(points, dtype=np.float64)
+
+    # Farthest point from an arbitrary point, and the farthest point from that one
+    a = points[((points - points[0]) ** 2).sum(axis=1).argmax()]
+    b = points[((points - a) ** 2).sum(axis=1).argmax()]
+
+    center = (a + b) / 2
+    radius = float(np.linalg.norm(b - a)) / 2
+
+    for _ in range(MAX_RITTER_ITERATIONS):
+        distances = ((points - center) ** 2).sum(axis=1)
+        farthest = distances.argmax()
+        distance = float(np.sqrt(distances[farthest]))
+
+        if distance <= radius * (1 + 1e-7):
+            break
+
+        # Grow the sphere just enough to touch the farthest point, moving its center towards it
+        new_radius = (radius + distance) / 2
+        center += (points[farthest] - center) * ((new_radius - radius) / distance)
+        radius = new_radius
+
+    # Make sure every point is inside, even after rounding errors or running out of iterations
+    radius = enclosing_radius(points, center)
+
+    box_center = (points.min(axis=0) + points.max(axis=0)) / 2
+    box_radius = enclosing_radius(points, box_center)
+
+    if box_radius < radius:
+        return box_center, box_radius
+
+    return center, radius
+
+
+def nud_bounding_sphere(points: np.ndarray) -> Tuple[float, ...]:
+    """Computes the bounding sphere (center, radius) of a NUD from the positions of all of its vertices.
+    The mesh group's first 4 values are the same sphere. Its last 4 values are not a bounding sphere of the vertices,
+    so they are left as they are."""
+
+    center, radius = ritter_sphere(points)
+    return (*center.tolist(), radius)
@@ -1,5 +1,13 @@
+import sys
+
+import bpy
+import numpy as np
+
 XFBIN_TEXTURES_OBJ = '#XFBIN Textures'
 
+# Blender 2.90 runs its scripts with the blender executable, so process pools need the path to its python executable
+PYTHON_EXECUTABLE = getattr(bpy.app, 'binary_path_python', None) or sys.executable
+
 def hex_str_to_int(val: str) -> int:
     return int(val.replace(' ', ''), 16)
 
@@ -17,3 +25,11 @@ def format_hex_str(value: str, size: int):
         pass
     else:
         return int_to_hex_str(val, size)
+
+
+def foreach_get_array(collection, attribute: str, size: int = 1, dtype=np.float32) -> np.ndarray:
+    """Reads an attribute of all items in a bpy collection into a (count x size) array, or a flat array if size is 1."""
+
+    array = np.empty(len(collection) * size, dtype=dtype)
+    collection.foreach_get(attribute, array)
+    return array.reshape(-1, size) if size > 1 else array
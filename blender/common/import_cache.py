@@ -0,0 +1,148 @@
+import hashlib
+import os
+from functools import lru_cache
+from itertools import chain
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+
+from ... import xfbin_lib
+from ...xfbin_lib.xfbin.structure.nud import NudMesh
+from ...xfbin_lib.xfbin.structure.xfbin import Xfbin
+from .mesh_cache import hash_items
+from .nud_arrays import NudMeshArrays
+
+# Increase this whenever the cached arrays change, to invalidate existing caches
+IMPORT_CACHE_VERSION = 2
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def iter_nuds(xfbin: Xfbin) -> Iterator:
+    """Yields each NUD of the XFBIN once, in a deterministic order."""
+
+    seen = set()
+    for page in xfbin.pages:
+        models = page.get_chunks_by_type('nuccChunkModel')
+
+        # Models referenced by the clumps are included as well, in case they are not in the page's chunks
+        for clump in page.get_chunks_by_type('nuccChunkClump'):
+            models = chain(models, clump.model_chunks, *map(lambda x: x.model_chunks, clump.model_groups))
+
+        for model in models:
+            nud = getattr(model, 'nud', None)
+            if nud and id(nud) not in seen:
+                seen.add(id(nud))
+                yield nud
+
+
+def iter_nud_meshes(xfbin: Xfbin) -> Iterator[NudMesh]:
+    for nud in iter_nuds(xfbin):
+        for group in nud.mesh_groups:
+            yield from group.meshes
+
+
+@lru_cache(maxsize=None)
+def xfbin_lib_fingerprint() -> str:
+    """Hashes the source files of xfbin_lib, as the cached arrays depend on how it parses the files."""
+
+    h = hashlib.blake2b(digest_size=20)
+    lib_dir = xfbin_lib.__path__[0]
+
+    for root, dirs, files in os.walk(lib_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith('.py'):
+                path = os.path.join(root, name)
+                h.update(os.path.relpath(path, lib_dir).encode('utf-8'))
+                with open(path, 'rb') as f:
+                    h.update(f.read())
+
+    return h.hexdigest()
+
+
+class XfbinImportCache:
+    """Directory of compressed NumPy archives, each storing the NudMeshArrays of the meshes that were decoded from an XFBIN.
+    Only arrays are stored, the files themselves are still parsed when they are imported.
+    The least recently used archives are removed when the directory exceeds max_size."""
+
+    def __init__(self, cache_dir: str, max_size: int = 1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def key(self, path: str, addon_version: Tuple[int, ...]) -> str:
+        return hash_items(file_hash(path), tuple(addon_version), IMPORT_CACHE_VERSION, xfbin_lib_fingerprint())
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.npz')
+
+    def load(self, key: str, mesh_count: int) -> Dict[int, NudMeshArrays]:
+        """Returns the cached arrays, keyed by the index of each mesh in iter_nud_meshes order.
+        mesh_count is the number of meshes in the parsed file, the archive is ignored if it does not match."""
+
+        path = self.entry_path(key)
+        if not os.path.isfile(path):
+            return dict()
+
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                if int(npz['mesh_count']) != mesh_count:
+                    return dict()
+
+                arrays: Dict[int, Dict[str, np.ndarray]] = dict()
+                for name in npz.files:
+                    # Mesh arrays are named "{mesh index}_{array name}"
+                    index, _, array_name = name.partition('_')
+                    if index.isdigit():
+                        arrays.setdefault(int(index), dict())[array_name] = npz[name]
+        except Exception as e:
+            # A corrupted or incompatible archive is simply rebuilt
+            print(f'Could not load the import cache {path}: {e}')
+            return dict()
+
+        # Mark the archive as recently used
+        os.utime(path)
+
+        return {i: NudMeshArrays.from_dict(a) for i, a in arrays.items()}
+
+    def save(self, key: str, mesh_count: int, mesh_arrays: Dict[int, NudMeshArrays]):
+        """Stores the arrays of the decoded meshes, keyed by their index in iter_nud_meshes order."""
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        arrays = {'mesh_count': np.array(mesh_count)}
+        for i, mesh in mesh_arrays.items():
+            for name, array in mesh.to_dict().items():
+                arrays[f'{i}_{name}'] = array
+
+        # Write to a temporary file first, so that an interrupted write never leaves a broken archive
+        path = self.entry_path(key)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(temp_path, path)
+
+        self.evict()
+    def evict(self):
+        entries = list()
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        size = sum(e[1] for e in entries)
+
+        # Remove the least recently used archives until the cache fits
+        for _, entry_size, name in sorted(entries):
+            if size <= self.max_size:
+                break
+
+            os.remove(os.path.join(self.cache_dir, name))
+            size -= entry_size
@@ -0,0 +1,134 @@
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+# Increase this whenever the encoding of NUD meshes changes, to invalidate persisted caches
+CACHE_VERSION = 7
+
+
+def hash_items(*items) -> str:
+    """Hashes arrays, strings, bytes and numbers into a hex digest. None items are hashed as well."""
+
+    h = hashlib.blake2b(digest_size=20)
+    for item in items:
+        if isinstance(item, np.ndarray):
+            h.update(f'{item.dtype.str}{item.shape}'.encode())
+            h.update(np.ascontiguousarray(item).tobytes())
+        elif isinstance(item, bytes):
+            h.update(item)
+        else:
+            h.update(repr(item).encode())
+
+        # Separate the items so that different splits of the same bytes don't collide
+        h.update(b'\0')
+
+    return h.hexdigest()
+
+
+class EncodedMeshCache:
+    """LRU cache of encoded NUD meshes, keyed by a hash of everything their encoding depends on.
+    Values are stored as read-only dicts of NumPy arrays, so they are cheap to store and never modified by an export."""
+
+    def __init__(self, max_size: int = 512 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self.entries: OrderedDict = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def reset_stats(self):
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def entry_size(arrays: Dict[str, np.ndarray]) -> int:
+        return sum(a.nbytes for a in arrays.values())
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        arrays = self.entries.get(key)
+        if arrays is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return arrays
+
+    def put(self, key: str, arrays: Dict[str, np.ndarray]):
+        for array in arrays.values():
+            array.setflags(write=False)
+
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= self.entry_size(old)
+
+        self.entries[key] = arrays
+        self.size += self.entry_size(arrays)
+        self.evict()
+
+    def evict(self):
+        # Remove the least recently used entries until the cache fits
+        while self.entries and self.size > self.max_size:
+            _, arrays = self.entries.popitem(last=False)
+            self.size -= self.entry_size(arrays)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def save(self, path: str):
+        """Saves the entries as a NumPy archive. Saved caches are not pickled, so loading a cache from an untrusted source can't run any code."""
+
+        keys = list(self.entries)
+        arrays = {'version': np.array(CACHE_VERSION), 'keys': np.array(keys, dtype=str)}
+
+        # Entry arrays are named "{entry index}_{array name}"
+        for i, key in enumerate(keys):
+            for name, array in self.entries[key].items():
+                arrays[f'{i}_{name}'] = array
+
+        # Write to a temporary file first, so that an interrupted write never leaves a broken cache
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temp_path, path)
+
+    def load(self, path: str) -> bool:
+        """Adds the entries of a cache saved with save().
+        Returns False if the file does not exist or is not a compatible cache."""
+
+        if not os.path.isfile(path):
+            return False
+
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                if int(npz['version']) != CACHE_VERSION:
+                    return False
+
+                keys = npz['keys'].tolist()
+                entry_arrays = [dict() for _ in keys]
+                for name in npz.files:
+                    index, _, array_name = name.partition('_')
+                    if index.isdigit():
+                        entry_arrays[int(index)][array_name] = npz[name]
+        except Exception:
+            return False
+
+        # Loaded entries are treated as older than the ones used in this session
+        for key, arrays in reversed(list(zip(keys, entry_arrays))):
+            if key not in self.entries:
+                for array in arrays.values():
+                    array.setflags(write=False)
+
+                self.entries[key] = arrays
+                self.entries.move_to_end(key, last=False)
+                self.size += self.entry_size(arrays)
+
+        self.evict()
+        return True
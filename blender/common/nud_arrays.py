@@ -0,0 +1,236 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from ...xfbin_lib.xfbin.structure.nud import NudMesh
+from .nud_vertices import NudVertexColumns
+
+
+def pos_scaled_to_blender_array(pos: np.ndarray) -> np.ndarray:
+    # From centimeter to meter
+    return pos * 0.01
+
+
+def uv_to_blender_array(uv: np.ndarray) -> np.ndarray:
+    uv = uv.copy()
+    uv[:, 1] = 1.0 - uv[:, 1]
+    return uv
+
+
+def pos_scaled_from_blender_array(pos: np.ndarray) -> np.ndarray:
+    # From meter to centimeter
+    return pos * 100
+
+
+def uv_from_blender_array(uv: np.ndarray) -> np.ndarray:
+    return uv_to_blender_array(uv)
+
+
+def transform_points(points: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """Transforms (count, 3) points by a 4x4 matrix."""
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def transform_directions(directions: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """Transforms (count, 3) directions by the rotation and scale of a 4x4 matrix, and normalizes them."""
+    return normalize_rows(directions @ matrix[:3, :3].T)
+
+
+def transform_normals(normals: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """Transforms (count, 3) normals by the inverse transpose of a 4x4 matrix, so they stay perpendicular to their faces
+    under non-uniform scale, and normalizes them."""
+    return normalize_rows(normals @ np.linalg.inv(matrix[:3, :3]))
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    # Zero vectors are left as they are
+    return vectors / np.where(lengths > 0, lengths, 1)
+
+
+class NudMeshArrays:
+    """Flat NumPy arrays of a NudMesh's vertices and faces, already converted to blender's coordinates.
+    Does not use bpy, so it can be created outside of blender's main thread."""
+
+    positions: np.ndarray
+    normals: Optional[np.ndarray]
+    colors: Optional[np.ndarray]
+    uvs: List[np.ndarray]
+    bone_ids: Optional[np.ndarray]
+    bone_weights: Optional[np.ndarray]
+
+    # (bone index, [(weight, vertex indices), ...]) of each bone, see group_weights_by_bone
+    weight_buckets: List[Tuple[int, List[Tuple[float, np.ndarray]]]]
+
+    faces: np.ndarray
+
+    def __init__(self, mesh: NudMesh):
+        columns = NudVertexColumns.from_mesh(mesh)
+        count = len(columns)
+
+        self.positions = pos_scaled_to_blender_array(columns['position'])
+        self.normals = columns.get('normal')
+
+        self.colors = None
+        if 'color' in columns:
+            self.colors = columns['color'] / 255
+
+        self.uvs = list()
+        if 'uv' in columns:
+            for i in range(columns['uv'].shape[1]):
+                self.uvs.append(uv_to_blender_array(columns['uv'][:, i]))
+
+        self.bone_ids, self.bone_weights = columns.get('bone_ids'), columns.get('bone_weights')
+        self.weight_buckets = weight_buckets(self.bone_ids, self.bone_weights)
+
+        self.faces = clean_faces(np.array(mesh.faces, dtype=np.int32).reshape(-1, 3), count)
+
+    def to_dict(self) -> Dict[str, np.ndarray]:
+        arrays = {'positions': self.positions, 'faces': self.faces}
+
+        for name in ('normals', 'colors', 'bone_ids', 'bone_weights'):
+            if getattr(self, name) is not None:
+                arrays[name] = getattr(self, name)
+
+        for i, uv in enumerate(self.uvs):
+            arrays[f'uv_{i}'] = uv
+
+        return arrays
+
+    @classmethod
+    def from_dict(cls, arrays: Dict[str, np.ndarray]) -> 'NudMeshArrays':
+        self = cls.__new__(cls)
+
+        self.positions = arrays['positions']
+        self.faces = arrays['faces']
+
+        self.normals = arrays.get('normals')
+        self.colors = arrays.get('colors')
+        self.bone_ids, self.bone_weights = arrays.get('bone_ids'), arrays.get('bone_weights')
+        self.weight_buckets = weight_buckets(self.bone_ids, self.bone_weights)
+
+        self.uvs = list()
+        while f'uv_{len(self.uvs)}' in arrays:
+            self.uvs.append(arrays[f'uv_{len(self.uvs)}'])
+
+        return self
+
+    @property
+    def vertex_count(self) -> int:
+        return len(self.positions)
+
+    @property
+    def loop_vertices(self) -> np.ndarray:
+        """Vertex index of every face corner, in face order."""
+        return self.faces.ravel()
+
+
+def clean_faces(faces: np.ndarray, vertex_count: int) -> np.ndarray:
+    """Removes the faces that blender would not accept: degenerate, out of range and duplicate ones.
+    The order of the remaining faces is preserved."""
+
+    valid = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+    valid &= (faces >= 0).all(axis=1) & (faces < vertex_count).all(axis=1)
+    faces = faces[valid]
+
+    # Faces using the same vertices in any order are duplicates, keep the first one only
+    _, first = np.unique(np.sort(faces, axis=1), axis=0, return_index=True)
+    return faces[np.sort(first)]
+
+
+def bone_arrays(mesh: NudMesh) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """Returns the (vertex x bone slot) bone index and weight arrays of a NudMesh, or None if it has no weights."""
+
+    vertices = mesh.vertices
+    if not (len(vertices) and vertices[0].bone_weights):
+        return None, None
+
+    columns = NudVertexColumns.from_vertices(vertices)
+    return columns['bone_ids'], columns['bone_weights']
+
+
+def group_weights_by_bone(bone_ids: np.ndarray, bone_weights: np.ndarray) -> Iterator[Tuple[int, List[Tuple[float, np.ndarray]]]]:
+    """Yields (bone index, [(weight, vertex indices), ...]) for each bone that has a positive weight, in ascending bone order.
+    Each (weight, vertex indices) bucket can be applied with a single VertexGroup.add call."""
+
+    vertex_indices = np.repeat(np.arange(len(bone_ids), dtype=np.int32), bone_ids.shape[1])
+    bones = bone_ids.ravel()
+    weights = bone_weights.ravel()
+
+    mask = weights > 0
+    vertex_indices, bones, weights = vertex_indices[mask], bones[mask], weights[mask]
+
+    # A vertex can reference the same bone more than once, the last reference is the one that gets applied
+    pairs = vertex_indices.astype(np.int64) * (int(bones.max(initial=0)) + 1) + bones
+    _, last = np.unique(pairs[::-1], return_index=True)
+    keep = np.sort(len(pairs) - 1 - last)
+    vertex_indices, bones, weights = vertex_indices[keep], bones[keep], weights[keep]
+
+    order = np.lexsort((vertex_indices, weights, bones))
+    vertex_indices, bones, weights = vertex_indices[order], bones[order], weights[order]
+
+    # Split the sorted arrays into (bone, weight) buckets
+    bucket_starts = np.flatnonzero((np.diff(bones) != 0) | (np.diff(weights) != 0)) + 1
+    bucket_starts = np.concatenate(([0], bucket_starts)) if len(bones) else bucket_starts
+
+    current_bone = None
+    buckets = list()
+    for start, end in zip(bucket_starts, np.append(bucket_starts[1:], len(bones))):
+        bone = int(bones[start])
+        if bone != current_bone:
+            if buckets:
+                yield current_bone, buckets
+            current_bone = bone
+            buckets = list()
+
+        buckets.append((float(weights[start]), vertex_indices[start:end]))
+
+    if buckets:
+        yield current_bone, buckets
+
+
+def weight_buckets(bone_ids: Optional[np.ndarray], bone_weights: Optional[np.ndarray]) -> List[Tuple[int, List[Tuple[float, np.ndarray]]]]:
+    if bone_weights is None:
+        return list()
+
+    return list(group_weights_by_bone(bone_ids, bone_weights))
+
+
+def select_bone_weights(vertex_count: int, vertex_indices: np.ndarray, group_indices: np.ndarray, weights: np.ndarray,
+                        group_to_bone: np.ndarray, max_bones: int = 4) -> Tuple[np.ndarray, np.ndarray]:
+    """Picks the most deforming bones of each vertex from a sparse (vertex, vertex group, weight) list, and normalizes their weights.
+
+    group_to_bone maps each vertex group index to its bone (coord) index, or -1 for groups that are not bones.
+    Returns (vertex count x max_bones) bone index and weight arrays. Vertices without any weights get bone 0 with weight 1."""
+
+    bone_ids = np.zeros((vertex_count, max_bones), dtype=np.int32)
+    bone_weights = np.zeros((vertex_count, max_bones), dtype=np.float32)
+
+    bones = group_to_bone[group_indices] if len(group_indices) else np.zeros(0, dtype=np.int32)
+    mask = bones >= 0
+    vertex_indices, bones, weights = vertex_indices[mask], bones[mask], weights[mask]
+
+    # Sort by vertex, then by descending weight. The sort is stable, so equal weights keep their vertex group order
+    order = np.lexsort((-weights, vertex_indices))
+    vertex_indices, bones, weights = vertex_indices[order], bones[order], weights[order]
+
+    # Rank of each weight inside its vertex, only the first max_bones are kept
+    starts = np.searchsorted(vertex_indices, vertex_indices, side='left')
+    ranks = np.arange(len(vertex_indices)) - starts
+    keep = ranks < max_bones
+
+    bone_ids[vertex_indices[keep], ranks[keep]] = bones[keep]
+    bone_weights[vertex_indices[keep], ranks[keep]] = weights[keep]
+
+    # Normalize the weights so they sum to 1
+    weight_sums = bone_weights.sum(axis=1)
+    weighted = weight_sums > 0
+    bone_weights[weighted] /= weight_sums[weighted, None]
+
+    # Vertices without weights are fully weighted to bone 0
+    bone_ids[~weighted] = 0
+    bone_weights[~weighted] = 0
+    bone_weights[~weighted, max_bones - 1] = 1
+
+    return bone_ids, bone_weights
@@ -0,0 +1,297 @@
+import math
+import multiprocessing
+import os
+import sys
+from collections import Counter
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .nud_arrays import select_bone_weights
+from .nud_vertices import (NudVertexColumns, deduplicate_vertices,
+                           vertex_format_dtypes)
+from .triangle_strips import (NUD_FACE_FLAG_STRIPS, strip_index_count,
+                              stripify)
+from .vertex_cache import (cache_miss_count, optimize_vertex_cache,
+                           reorder_vertices)
+from .vertex_quantization import (QuantizationTolerances,
+                                  choose_vertex_formats)
+
+# Batches with fewer triangle corners than this are encoded serially
+MIN_PARALLEL_CORNERS = 300000
+
+# Most processes a ProcessPoolExecutor can use on Windows
+MAX_WINDOWS_WORKERS = 61
+
+
+class NudMeshWeights:
+    """Sparse vertex group weights of a mesh, and the mapping of its vertex groups to coord indices."""
+
+    def __init__(self, vertex_count: int, vertex_indices: np.ndarray, group_indices: np.ndarray, weights: np.ndarray, group_to_coord: np.ndarray):
+        self.vertex_count = vertex_count
+        self.vertex_indices = vertex_indices
+        self.group_indices = group_indices
+        self.weights = weights
+        self.group_to_coord = group_to_coord
+
+
+class NudMeshJob:
+    """Everything needed to encode the vertices and faces of a NudMesh, after it was extracted from blender.
+    Contains no bpy data, so it can be sent to another process."""
+
+    def __init__(self, columns: NudVertexColumns, tri_vertices: np.ndarray, vertex_dtypes: Dict[str, np.dtype], weights: Optional[NudMeshWeights],
+                 max_vertices: Optional[int] = None, max_faces: Optional[int] = None, optimize_vertex_cache: bool = False,
+                 use_triangle_strips: bool = False, vertex_formats: Optional[Tuple[int, int, int]] = None,
+                 quantization: Optional[QuantizationTolerances] = None):
+        # Attributes of every triangle corner, and the mesh vertex each corner belongs to
+        self.columns = columns
+        self.tri_vertices = tri_vertices
+
+        self.vertex_dtypes = vertex_dtypes
+        self.weights = weights
+
+        # Meshes over these limits are split into several meshes. None means no splitting
+        self.max_vertices = max_vertices
+        self.max_faces = max_faces
+
+        # Reorder the faces for the post-transform vertex cache
+        self.optimize_vertex_cache = optimize_vertex_cache
+
+        # Encode the faces as triangle strips, if they are smaller than the triangle list
+        self.use_triangle_strips = use_triangle_strips
+
+        # (vertex_type, bone_type, uv_type) that vertex_dtypes were made from. If quantization is set,
+        # the smallest formats that store the vertices within its tolerances are used instead
+        self.vertex_formats = vertex_formats
+        self.quantization = quantization
+
+
+# Vertex columns, faces and face flag of a single NudMesh. The faces are either triangles, or triangle strips
+# (one tuple per strip), and the face flag is None if the mesh's own flag should be used.
+# The vertices stay in columns until the NudMesh is created, so the result is cheap to transfer and cache
+EncodedNudMesh = Tuple[NudVertexColumns, List[Tuple[int, ...]], Optional[int]]
+
+
+class EncodedNudMeshes:
+    """Result of encoding a mesh: the NudMeshes it was encoded into (more than one if it was split),
+    the (vertex_type, bone_type, uv_type) they were encoded with if they were chosen by quantization,
+    and statistics about the encoding, summed over all of them."""
+
+    def __init__(self, parts: List[EncodedNudMesh], stats: Dict[str, int], vertex_formats: Optional[Tuple[int, int, int]] = None):
+        self.parts = parts
+        self.stats = stats
+        self.vertex_formats = vertex_formats
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Converts the result to plain NumPy arrays, so it can be stored without pickle."""
+
+        arrays = {
+            'part_count': np.array(len(self.parts)),
+            'stat_names': np.array(list(self.stats), dtype=str),
+            'stat_values': np.array(list(self.stats.values()), dtype=np.int64),
+            'vertex_formats': np.array(self.vertex_formats or (), dtype=np.int32),
+        }
+
+        # Part arrays are named "{part index}_{array name}"
+        for i, (columns, faces, face_flag) in enumerate(self.parts):
+            for name, column in columns.columns.items():
+                arrays[f'{i}_{name}'] = column
+
+            arrays[f'{i}_face_indices'] = np.fromiter(chain.from_iterable(faces), dtype=np.int32)
+            arrays[f'{i}_face_sizes'] = np.fromiter(map(len, faces), dtype=np.int32, count=len(faces))
+            arrays[f'{i}_face_flag'] = np.array(-1 if face_flag is None else face_flag)
+
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'EncodedNudMeshes':
+        part_arrays = [dict() for _ in range(int(arrays['part_count']))]
+        for name, array in arrays.items():
+            index, _, array_name = name.partition('_')
+            if index.isdigit():
+                part_arrays[int(index)][array_name] = array
+
+        parts = list()
+        for a in part_arrays:
+            face_indices, face_sizes, face_flag = a.pop('face_indices'), a.pop('face_sizes'), int(a.pop('face_flag'))
+            # Slice python lists instead of arrays, as there can be hundreds of thousands of faces
+            indices = face_indices.tolist()
+            ends = np.cumsum(face_sizes).tolist()
+            faces = [tuple(indices[start:end]) for start, end in zip([0] + ends, ends)]
+
+            parts.append((NudVertexColumns(a), faces, None if face_flag < 0 else face_flag))
+
+        stats = dict(zip(arrays['stat_names'].tolist(), arrays['stat_values'].tolist()))
+        vertex_formats = tuple(arrays['vertex_formats'].tolist()) or None
+
+        return cls(parts, stats, vertex_formats)
+
+
+def partition_faces(faces: np.ndarray, positions: np.ndarray, max_vertices: int, max_faces: int) -> List[np.ndarray]:
+    """Splits the (count, 3) faces into spatially coherent parts that each use at most max_vertices vertices and have at most max_faces faces.
+
+    Parts are split recursively along the longest axis of their face centers, into sides sized for the number
+    of parts each side needs, so the cuts are planar and few vertices are duplicated along them.
+    Returns the face indices of each part, in spatial order."""
+
+    centers = positions[faces].mean(axis=1)
+
+    parts = list()
+    stack = [np.arange(len(faces))]
+    while stack:
+        part = stack.pop()
+
+        vertex_count = len(np.unique(faces[part]))
+        if (vertex_count <= max_vertices and len(part) <= max_faces) or len(part) < 2:
+            parts.append(part)
+            continue
+
+        # Lower bound of the parts needed, the sides are split again if the seams push them over the limits
+        count = max(2, math.ceil(max(vertex_count / max_vertices, len(part) / max_faces)))
+        split = len(part) * (count // 2) // count
+
+        part_centers = centers[part]
+        axis = np.argmax(part_centers.max(axis=0) - part_centers.min(axis=0))
+        order = np.argpartition(part_centers[:, axis], split)
+
+        # The first side is pushed last, so it is processed first
+        stack.append(part[order[split:]])
+        stack.append(part[order[:split]])
+
+    return parts
+
+
+def encode_nud_mesh(job: NudMeshJob) -> EncodedNudMeshes:
+    """Processes the weights and merges the identical vertices.
+    Returns the vertices and the faces of the NudMesh, or of each part if it had to be split, with the encoding statistics."""
+
+    columns = dict(job.columns.columns)
+
+    if job.weights:
+        w = job.weights
+        bone_ids, bone_weights = select_bone_weights(
+            w.vertex_count, w.vertex_indices, w.group_indices, w.weights, w.group_to_coord)
+
+        columns['bone_ids'] = bone_ids[job.tri_vertices]
+        columns['bone_weights'] = bone_weights[job.tri_vertices]
+
+    vertex_dtypes = job.vertex_dtypes
+    vertex_formats = None
+
+    if job.quantization and job.vertex_formats:
+        vertex_formats = choose_vertex_formats(columns, *job.vertex_formats, job.quantization)
+        vertex_dtypes = vertex_format_dtypes(*vertex_formats)
+
+    corners = NudVertexColumns(columns)
+
+    # Size of a single stored vertex, before and after quantization
+    vertex_sizes = (corners.record_dtype(job.vertex_dtypes).itemsize, corners.record_dtype(vertex_dtypes).itemsize)
+
+    vertices, indices = deduplicate_vertices(corners, vertex_dtypes)
+    faces = indices.reshape(-1, 3)
+
+    if job.max_vertices is None or (len(vertices) <= job.max_vertices and len(faces) <= job.max_faces):
+        face_parts = [np.arange(len(faces))]
+    else:
+        face_parts = partition_faces(faces, vertices['position'], job.max_vertices, job.max_faces)
+
+    parts = list()
+    stats = Counter()
+    for part in face_parts:
+        # Keep only the vertices each part uses, in the order they are first used
+        part_vertices, part_faces = reorder_vertices(faces[part])
+
+        if job.optimize_vertex_cache:
+            stats['cache_misses_before'] += cache_miss_count(part_faces)
+
+            part_faces = part_faces[optimize_vertex_cache(part_faces, len(part_vertices))]
+            order, part_faces = reorder_vertices(part_faces)
+            part_vertices = part_vertices[order]
+
+            stats['cache_misses_after'] += cache_miss_count(part_faces)
+
+        stats['vertices'] += len(part_vertices)
+        stats['faces'] += len(part_faces)
+
+        if vertex_formats:
+            stats['vertex_bytes_before'] += len(part_vertices) * vertex_sizes[0]
+            stats['vertex_bytes_after'] += len(part_vertices) * vertex_sizes[1]
+
+        part_face_list = list(map(tuple, part_faces.tolist()))
+        face_flag = None
+
+        if job.use_triangle_strips:
+            strips = stripify(part_faces)
+
+            # Without strips, every triangle is written as its own 3 indices followed by a restart index
+            list_indices = strip_index_count(part_face_list)
+            strip_indices = strip_index_count(strips)
+            stats['list_indices'] += list_indices
+
+            # Fall back to separate triangles if the strips don't save anything
+            if strip_indices < list_indices:
+                part_face_list = strips
+                face_flag = NUD_FACE_FLAG_STRIPS
+                stats['strip_indices'] += strip_indices
+            else:
+                stats['strip_indices'] += list_indices
+
+        parts.append((vertices.take(part_vertices), part_face_list, face_flag))
+
+    return EncodedNudMeshes(parts, dict(stats), vertex_formats)
+
+
+class NudMeshEncoder:
+    """Encodes NudMeshJobs in a process pool that is only created once it is needed, and reused until the encoder is closed.
+    Small batches are encoded serially, as spawning the workers would take longer than encoding them.
+    If the pool fails, it is not used again, and the jobs are encoded serially instead."""
+
+    def __init__(self, workers: int = 1, executable: str = None):
+        # Windows can't wait on more than 61 processes, and more workers than CPUs don't help anyway
+        max_workers = min(os.cpu_count() or 1, MAX_WINDOWS_WORKERS if sys.platform == 'win32' else math.inf)
+        self.workers = max(1, min(workers, max_workers))
+
+        self.executable = executable
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+        # The exception that made the encoder fall back to serial encoding, if any
+        self.error: Optional[Exception] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+
+    def encode(self, jobs: List[NudMeshJob]) -> List[EncodedNudMeshes]:
+        """Encodes all jobs. The results are always in the same order as the jobs, and are identical to encoding them serially."""
+
+        corners = sum(len(job.tri_vertices) for job in jobs)
+        if self.workers <= 1 or len(jobs) < 2 or corners < MIN_PARALLEL_CORNERS:
+            return list(map(encode_nud_mesh, jobs))
+
+        try:
+            if not self.executor:
+                # Spawn the workers instead of forking blender's process
+                mp_context = multiprocessing.get_context('spawn')
+                if self.executable:
+                    mp_context.set_executable(self.executable)
+
+                self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp_context)
+
+            return list(self.executor.map(encode_nud_mesh, jobs))
+        except Exception as e:
+            # A broken pool (or one that could not start) should not stop the export.
+            # Errors in encode_nud_mesh itself are raised again by the serial encoding
+            self.error = e
+            self.close()
+            self.workers = 1
+
+            return list(map(encode_nud_mesh, jobs))
@@ -0,0 +1,238 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ...xfbin_lib.xfbin.structure.nud import NudMesh, NudVertex
+
+
+def storage_scale(attribute: str, dtype: np.dtype) -> float:
+    """Returns the factor that converts an attribute from its NudVertex range to its stored range."""
+
+    if attribute == 'bone_weights' and dtype.kind == 'u':
+        # Byte weights are normalized to 0-255
+        return 255.0
+    if attribute == 'color' and dtype.kind == 'f':
+        # Half float colors are normalized to 0-1
+        return 1 / 255
+
+    return 1.0
+
+
+def quantize_weights(weights: np.ndarray, scale: float) -> np.ndarray:
+    """Rounds (count, size) bone weights to integers in the 0-scale range, while keeping the sum of each vertex's weights.
+    Each weight is rounded down, then the units lost by rounding go to the weights with the largest remainders.
+    Weights that sum to 1 therefore always sum to exactly scale."""
+
+    scaled = np.clip(weights, 0, 1) * scale
+    quantized = np.floor(scaled)
+
+    # Units each vertex lost by rounding down
+    missing = (np.rint(scaled.sum(axis=1)) - quantized.sum(axis=1)).astype(np.int64)
+
+    # Rank the weights of each vertex by their remainders, largest first, and add 1 to the first missing ones
+    ranks = np.argsort(np.argsort(quantized - scaled, axis=1, kind='stable'), axis=1)
+    quantized += ranks < missing[:, None]
+
+    return np.minimum(quantized, scale)
+
+
+def vertex_format_dtypes(vertex_type: int, bone_type: int, uv_type: int) -> Dict[str, np.dtype]:
+    """Returns the storage dtype of each attribute that is written for the given NudVertexType, NudBoneType and NudUvType.
+    Attributes that are not written by the format are not included."""
+
+    vertex_type, bone_type, uv_type = int(vertex_type), int(bone_type), int(uv_type)
+
+    dtypes = {'position': np.dtype('>f4')}
+
+    if vertex_type in (1, 2, 3):
+        dtypes['normal'] = np.dtype('>f4')
+    elif vertex_type in (6, 7):
+        dtypes['normal'] = np.dtype('>f2')
+
+    # The format of vertex type 2 is unknown, so its tangents are kept in case it stores them
+    if vertex_type in (2, 3, 7):
+        dtypes['tangent'] = dtypes['bitangent'] = dtypes['normal']
+
+    if uv_type == 2:
+        dtypes['color'] = np.dtype('u1')
+    elif uv_type == 4:
+        dtypes['color'] = np.dtype('>f2')
+
+    # UVs are always stored as half floats
+    dtypes['uv'] = np.dtype('>f2')
+
+    if bone_type == 16:
+        dtypes['bone_ids'] = np.dtype('>u4')
+        dtypes['bone_weights'] = np.dtype('>f4')
+    elif bone_type == 32:
+        dtypes['bone_ids'] = np.dtype('>u2')
+        dtypes['bone_weights'] = np.dtype('>f2')
+    elif bone_type == 64:
+        dtypes['bone_ids'] = dtypes['bone_weights'] = np.dtype('u1')
+
+    return dtypes
+
+
+class NudVertexColumns:
+    """Columnar storage for the vertices of a NudMesh: one array per NudVertex attribute, in the NUD's coordinates.
+
+    Shapes are (count, size) for every attribute except uv, which is (count, channels, 2).
+    Colors are in the 0-255 range, like in NudVertex."""
+
+    columns: Dict[str, np.ndarray]
+
+    def __init__(self, columns: Dict[str, Optional[np.ndarray]]):
+        self.columns = {k: v for k, v in columns.items() if v is not None}
+
+    def __len__(self):
+        return len(self.columns['position']) if 'position' in self.columns else 0
+
+    def __contains__(self, attribute: str):
+        return attribute in self.columns
+
+    def __getitem__(self, attribute: str) -> np.ndarray:
+        return self.columns[attribute]
+
+    def get(self, attribute: str) -> Optional[np.ndarray]:
+        return self.columns.get(attribute)
+
+    @classmethod
+    def from_mesh(cls, mesh: NudMesh) -> 'NudVertexColumns':
+        return cls.from_vertices(mesh.vertices)
+
+    @classmethod
+    def from_vertices(cls, vertices: List[NudVertex]) -> 'NudVertexColumns':
+        count = len(vertices)
+        columns = {'position': np.array([v.position for v in vertices], dtype=np.float32).reshape(count, 3)}
+
+        if not count:
+            return cls(columns)
+
+        # All vertices of a mesh share the same format, so the first vertex tells which attributes exist
+        first = vertices[0]
+
+        for attribute in ('normal', 'tangent', 'bitangent'):
+            if getattr(first, attribute, None):
+                columns[attribute] = np.array([getattr(v, attribute)[:3]
+                                              for v in vertices], dtype=np.float32).reshape(count, 3)
+
+        if first.color:
+            columns['color'] = np.array([v.color for v in vertices], dtype=np.float32).reshape(count, 4)
+
+        if first.uv:
+            columns['uv'] = np.array([v.uv for v in vertices], dtype=np.float32).reshape(count, len(first.uv), 2)
+
+        if first.bone_weights:
+            columns['bone_ids'] = np.array([v.bone_ids for v in vertices], dtype=np.int32).reshape(count, -1)
+            columns['bone_weights'] = np.array([v.bone_weights for v in vertices], dtype=np.float32).reshape(count, -1)
+
+        return cls(columns)
+
+    def take(self, indices: np.ndarray) -> 'NudVertexColumns':
+        """Returns the given vertices, in the order of indices."""
+        return NudVertexColumns({k: v[indices] for k, v in self.columns.items()})
+
+    def record_dtype(self, dtypes: Dict[str, np.dtype]) -> np.dtype:
+        """Builds a structured dtype with one field per stored attribute, using the storage dtypes of a vertex format."""
+
+        fields = list()
+        for attribute, column in self.columns.items():
+            if attribute in dtypes:
+                fields.append((attribute, dtypes[attribute], column.shape[1:]))
+
+        return np.dtype(fields)
+
+    def to_records(self, dtypes: Dict[str, np.dtype]) -> np.ndarray:
+        """Packs the vertices into a structured array in the given storage dtypes.
+        Attributes that the format does not store are dropped, and values are rounded to the storage precision."""
+
+        records = np.empty(len(self), dtype=self.record_dtype(dtypes))
+        for attribute in records.dtype.names:
+            dtype = dtypes[attribute]
+            if attribute == 'bone_weights' and dtype.kind in 'iu':
+                # Byte weights still have to sum to 1
+                column = quantize_weights(self.columns[attribute], storage_scale(attribute, dtype))
+            else:
+                column = self.columns[attribute] * storage_scale(attribute, dtype)
+
+            if dtype.kind in 'iu':
+                column = np.clip(np.rint(column), 0, np.iinfo(dtype).max)
+            records[attribute] = column
+
+        return records
+
+    @classmethod
+    def from_records(cls, records: np.ndarray) -> 'NudVertexColumns':
+        columns = dict()
+        for attribute in records.dtype.names:
+            column = records[attribute] / storage_scale(attribute, records.dtype[attribute].base)
+            columns[attribute] = column.astype(np.int32 if attribute == 'bone_ids' else np.float32)
+
+        return cls(columns)
+
+    def vertex(self, index: int) -> NudVertex:
+        """Returns a NudVertex view of a single vertex, for code that still needs one."""
+        return NudVertexColumns({k: v[index:index + 1] for k, v in self.columns.items()}).to_vertices()[0]
+
+    def to_vertices(self) -> List[NudVertex]:
+        """Creates a NudVertex for each vertex, for code that still needs them (like the NUD writer)."""
+
+        count = len(self)
+        columns = self.columns
+
+        # Convert each column to python values once, instead of once per vertex
+        def rows(attribute, convert, default=None):
+            if attribute not in columns:
+                return [default] * count
+            return list(map(convert, columns[attribute].tolist()))
+
+        positions = rows('position', tuple)
+        normals = rows('normal', tuple)
+        tangents = rows('tangent', tuple)
+        bitangents = rows('bitangent', tuple)
+        colors = rows('color', lambda c: tuple(int(round(x)) for x in c), tuple())
+        uvs = rows('uv', lambda uv: list(map(tuple, uv)))
+        bone_ids = rows('bone_ids', tuple, tuple())
+        bone_weights = rows('bone_weights', tuple, tuple())
+
+        vertices = [None] * count
+        for i in range(count):
+            v = vertices[i] = NudVertex()
+            v.position = positions[i]
+            v.normal = normals[i]
+            v.tangent = tangents[i]
+            v.bitangent = bitangents[i]
+            v.color = colors[i]
+            v.uv = uvs[i] if uvs[i] is not None else list()
+            v.bone_ids = bone_ids[i]
+            v.bone_weights = bone_weights[i]
+
+        return vertices
+
+
+def deduplicate_vertices(columns: NudVertexColumns, dtypes: Dict[str, np.dtype]) -> Tuple[NudVertexColumns, np.ndarray]:
+    """Merges identical vertices after packing them into the storage dtypes of their vertex format,
+    so vertices that only differ below the format's precision are merged as well.
+    Returns the unique (quantized) vertices in first-seen order, and the index of each input vertex in the unique vertices."""
+
+    if not len(columns):
+        return columns, np.zeros(0, dtype=np.int32)
+
+    records = columns.to_records(dtypes)
+
+    # Adding 0 turns -0.0 into 0.0, so that both compare equal as bytes
+    for attribute in records.dtype.names:
+        if records.dtype[attribute].base.kind == 'f':
+            records[attribute] += 0
+
+    # Compare each packed vertex as a single fixed-width row of bytes
+    rows = records.view(np.dtype((np.void, records.dtype.itemsize)))
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+
+    # np.unique sorts the vertices, so remap them to the order in which they first appeared
+    order = np.argsort(first)
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(order))
+
+    unique = NudVertexColumns.from_records(records[first[order]])
+    return unique, remap[inverse.ravel()].astype(np.int32)
@@ -0,0 +1,111 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# NudMesh face flag of triangle strips, the default. 0x40 is a plain triangle list.
+# With this flag, the writer ends each face tuple with a 0xFFFF restart index, so a tuple can hold a whole strip
+NUD_FACE_FLAG_STRIPS = 0x04
+
+
+def build_edge_triangles(faces: List[List[int]]) -> Dict[Tuple[int, int], List[int]]:
+    """Maps each directed edge (in the winding order of the faces) to the triangles that contain it."""
+
+    edges = dict()
+    for t, (a, b, c) in enumerate(faces):
+        edges.setdefault((a, b), list()).append(t)
+        edges.setdefault((b, c), list()).append(t)
+        edges.setdefault((c, a), list()).append(t)
+
+    return edges
+
+
+def next_strip_triangle(edges: Dict[Tuple[int, int], List[int]], used: List[bool], faces: List[List[int]],
+                        edge: Tuple[int, int]) -> Tuple[int, int]:
+    """Returns an unused triangle that contains the directed edge, and its vertex opposite to it. (-1, -1) if there is none."""
+
+    for t in edges.get(edge, ()):
+        if not used[t]:
+            a, b, c = faces[t]
+            if (a, b) == edge:
+                return t, c
+            if (b, c) == edge:
+                return t, a
+            return t, b
+
+    return -1, -1
+
+
+def walk_strip(edges: Dict[Tuple[int, int], List[int]], used: List[bool], faces: List[List[int]],
+               start: List[int], mark: bool) -> List[int]:
+    """Extends a strip from the start triangle, in the given vertex order, for as long as unused neighbours are found.
+    Returns the vertex indices of the strip, and marks its triangles as used if mark is set."""
+
+    strip = list(start)
+    visited = list()
+
+    while True:
+        p, q = strip[-2], strip[-1]
+
+        # Odd triangles of a strip have their first two vertices swapped to keep the same winding,
+        # so the edge the next triangle shares is reversed for them
+        edge = (p, q) if (len(strip) - 2) % 2 == 0 else (q, p)
+
+        t, v = next_strip_triangle(edges, used, faces, edge)
+        if t < 0:
+            break
+
+        # Mark the triangle temporarily, so the walk doesn't visit it twice
+        used[t] = True
+        visited.append(t)
+        strip.append(v)
+
+    if not mark:
+        for t in visited:
+            used[t] = False
+
+    return strip
+
+
+def stripify(faces: np.ndarray) -> List[Tuple[int, ...]]:
+    """Converts (count, 3) triangle faces into triangle strips, one tuple of vertex indices per strip.
+
+    Strips are built greedily: each one starts from the first unused triangle in face order, in whichever of its
+    3 rotations gives the longest strip, and grows through unused neighbours with a consistent winding.
+    Starting in face order keeps the locality of faces that were optimized for the vertex cache.
+    Decoding the strips gives back exactly the same triangles, with the same winding."""
+
+    face_list = faces.tolist()
+    edges = build_edge_triangles(face_list)
+    used = [False] * len(face_list)
+
+    strips = list()
+    for t, (a, b, c) in enumerate(face_list):
+        if used[t]:
+            continue
+
+        used[t] = True
+        rotations = ([a, b, c], [b, c, a], [c, a, b])
+        best = max(rotations, key=lambda r: len(walk_strip(edges, used, face_list, r, False)))
+
+        strips.append(tuple(walk_strip(edges, used, face_list, best, True)))
+
+    return strips
+
+
+def strip_index_count(strips: List[Tuple[int, ...]]) -> int:
+    """Returns the number of indices the writer emits for the strips (or triangles), including the restart after each one."""
+    return sum(len(s) + 1 for s in strips)
+
+
+def strip_triangles(strips: List[Tuple[int, ...]]) -> np.ndarray:
+    """Decodes triangle strips back into (count, 3) faces."""
+
+    faces = list()
+    for strip in strips:
+        for j in range(len(strip) - 2):
+            if j % 2 == 0:
+                faces.append((strip[j], strip[j + 1], strip[j + 2]))
+            else:
+                faces.append((strip[j + 1], strip[j], strip[j + 2]))
+
+    return np.array(faces, dtype=np.int32).reshape(-1, 3)
@@ -0,0 +1,137 @@
+from collections import deque
+from typing import Tuple
+
+import numpy as np
+
+# Size of the simulated post-transform vertex cache, for both the optimizer and the statistics
+VERTEX_CACHE_SIZE = 32
+
+# Scoring constants from Tom Forsyth's "Linear-Speed Vertex Cache Optimisation"
+CACHE_DECAY_POWER = 1.5
+LAST_TRIANGLE_SCORE = 0.75
+VALENCE_BOOST_SCALE = 2.0
+VALENCE_BOOST_POWER = 0.5
+
+
+def cache_miss_count(faces: np.ndarray, cache_size: int = VERTEX_CACHE_SIZE) -> int:
+    """Counts the vertex transforms needed to draw the faces with a FIFO post-transform cache."""
+
+    cache = deque()
+    cached = set()
+    misses = 0
+
+    for v in faces.ravel().tolist():
+        if v in cached:
+            continue
+
+        misses += 1
+        cache.append(v)
+        cached.add(v)
+        if len(cache) > cache_size:
+            cached.discard(cache.popleft())
+
+    return misses
+
+
+def acmr_atvr(faces: np.ndarray, vertex_count: int, cache_size: int = VERTEX_CACHE_SIZE) -> Tuple[float, float]:
+    """Returns the average cache miss ratio (transforms per triangle, 0.5 to 3)
+    and the average transform to vertex ratio (transforms per vertex, 1 is optimal) of the faces."""
+
+    misses = cache_miss_count(faces, cache_size)
+    return misses / max(len(faces), 1), misses / max(vertex_count, 1)
+
+
+def optimize_vertex_cache(faces: np.ndarray, vertex_count: int, cache_size: int = VERTEX_CACHE_SIZE) -> np.ndarray:
+    """Reorders the (count, 3) faces for the post-transform vertex cache, using Tom Forsyth's linear-speed algorithm.
+    The triangle with the best score is emitted next, where vertices score higher the more recently they were used
+    and the fewer triangles they have left. Only the triangles of the cached vertices are rescored after each step.
+    Returns the new order of the faces."""
+
+    face_count = len(faces)
+    if face_count == 0:
+        return np.zeros(0, dtype=np.int32)
+
+    # Unique (vertex, triangle) pairs, so degenerate triangles don't count their vertices twice
+    triangles = np.repeat(np.arange(face_count, dtype=np.int64), 3)
+    pairs = np.unique(faces.ravel().astype(np.int64) * face_count + triangles)
+    pair_vertices, pair_triangles = pairs // face_count, pairs % face_count
+
+    valence = np.bincount(pair_vertices, minlength=vertex_count)
+    offsets = np.concatenate(([0], np.cumsum(valence))).tolist()
+
+    # Triangles that still have to be emitted for each vertex
+    pair_triangles = pair_triangles.tolist()
+    vertex_triangles = [pair_triangles[offsets[v]:offsets[v + 1]] for v in range(vertex_count)]
+    triangle_vertices = [list(dict.fromkeys(f)) for f in faces.tolist()]
+
+    # Score lookup tables, indexed by cache position and by remaining valence
+    cache_scores = [LAST_TRIANGLE_SCORE] * 3 + [
+        (1 - (i - 3) / (cache_size - 3)) ** CACHE_DECAY_POWER for i in range(3, cache_size)]
+    valence_scores = [0.0] + [VALENCE_BOOST_SCALE * v ** -VALENCE_BOOST_POWER for v in range(1, int(valence.max()) + 1)]
+
+    remaining = valence.tolist()
+    cache_positions = [-1] * vertex_count
+    vertex_scores = [valence_scores[r] for r in remaining]
+    triangle_scores = [sum(vertex_scores[v] for v in t) for t in triangle_vertices]
+    emitted = [False] * face_count
+
+    order = list()
+    cache = list()
+    best = max(range(face_count), key=triangle_scores.__getitem__)
+    cursor = 0
+
+    while len(order) < face_count:
+        if best < 0:
+            # None of the cached vertices has triangles left, continue from the first triangle that was not emitted yet
+            while emitted[cursor]:
+                cursor += 1
+            best = cursor
+
+        order.append(best)
+        emitted[best] = True
+
+        best_vertices = triangle_vertices[best]
+        for v in best_vertices:
+            remaining[v] -= 1
+            vertex_triangles[v].remove(best)
+
+        # The triangle's vertices move to the front of the cache, and the last ones are pushed out of it
+        cache = list(dict.fromkeys(best_vertices + cache))
+        for v in cache[cache_size:]:
+            cache_positions[v] = -1
+        evicted = cache[cache_size:]
+        cache = cache[:cache_size]
+        for i, v in enumerate(cache):
+            cache_positions[v] = i
+
+        # Rescore the vertices whose position or valence changed, and pick the best triangle among theirs
+        best = -1
+        best_score = -1.0
+        for v in cache + evicted:
+            score = valence_scores[remaining[v]] if remaining[v] else 0.0
+            if remaining[v] and cache_positions[v] >= 0:
+                score += cache_scores[cache_positions[v]]
+
+            delta = score - vertex_scores[v]
+            vertex_scores[v] = score
+
+            for t in vertex_triangles[v]:
+                triangle_scores[t] += delta
+                if triangle_scores[t] > best_score:
+                    best_score = triangle_scores[t]
+                    best = t
+
+    return np.array(order, dtype=np.int32)
+
+
+def reorder_vertices(faces: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Orders the vertices by their first use in the faces, so they are fetched sequentially. Unused vertices are dropped.
+    Returns the used vertices in their new order, and the faces using the new indices."""
+
+    used, first = np.unique(faces.ravel(), return_index=True)
+    order = used[np.argsort(first)]
+
+    remap = np.empty(int(used.max(initial=-1)) + 1, dtype=np.int32)
+    remap[order] = np.arange(len(order), dtype=np.int32)
+
+    return order.astype(np.int32), remap[faces]
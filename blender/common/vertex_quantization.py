@@ -0,0 +1,74 @@
+from typing import Dict, Tuple
+
+import numpy as np
+
+from .nud_vertices import quantize_weights
+
+# Compact vertex formats that store the same attributes in half floats
+HALF_VERTEX_TYPES = {1: 6, 3: 7}
+
+# Bone formats from the largest to the smallest, with the largest bone index each one can store
+BONE_TYPE_LIMITS = {16: 2 ** 32, 32: 2 ** 16, 64: 2 ** 8}
+
+# Vertex color formats: half float and byte
+COLOR_HALF, COLOR_BYTE = 4, 2
+
+
+class QuantizationTolerances:
+    """Largest rounding errors allowed when storing attributes in a more compact format."""
+
+    def __init__(self, normal: float = 1e-3, weight: float = 5e-3):
+        # Per component, for unit length normals, tangents and bitangents
+        self.normal = normal
+
+        # Per weight, in the 0-1 range
+        self.weight = weight
+
+
+def half_error(values: np.ndarray) -> float:
+    """Largest absolute error of storing the values as half floats. Values out of the half float range give inf."""
+
+    with np.errstate(over='ignore', invalid='ignore'):
+        error = np.abs(values.astype(np.float16).astype(np.float32) - values)
+
+    return float(np.nan_to_num(error, nan=np.inf).max(initial=0))
+
+
+def byte_weight_error(weights: np.ndarray) -> float:
+    """Largest absolute error of storing the weights as bytes, rounded so that each vertex's weights keep their sum."""
+    return float(np.abs(quantize_weights(weights, 255.0) / 255 - weights).max(initial=0))
+
+
+def choose_vertex_formats(columns: Dict[str, np.ndarray], vertex_type: int, bone_type: int, uv_type: int,
+                          tolerances: QuantizationTolerances) -> Tuple[int, int, int]:
+    """Picks the smallest vertex, bone and color formats that store the columns within the tolerances.
+    Colors always use bytes, as they are exported as whole 0-255 values in both formats.
+    The formats only change to ones that store the same attributes, and never to larger ones.
+    Returns the (vertex_type, bone_type, uv_type) to use."""
+
+    vertex_type, bone_type, uv_type = int(vertex_type), int(bone_type), int(uv_type)
+
+    if vertex_type in HALF_VERTEX_TYPES:
+        error = max(half_error(columns[a]) for a in ('normal', 'tangent', 'bitangent') if a in columns)
+        if error <= tolerances.normal:
+            vertex_type = HALF_VERTEX_TYPES[vertex_type]
+
+    if bone_type in BONE_TYPE_LIMITS and 'bone_ids' in columns:
+        bone_ids, bone_weights = columns['bone_ids'], columns['bone_weights']
+        max_bone = int(bone_ids.max(initial=0))
+
+        # Try the smallest format first
+        for candidate in (64, 32):
+            if candidate <= bone_type or max_bone >= BONE_TYPE_LIMITS[candidate]:
+                continue
+
+            error = byte_weight_error(bone_weights) if candidate == 64 else half_error(bone_weights)
+            if error <= tolerances.weight:
+                bone_type = candidate
+                break
+
+    if uv_type == COLOR_HALF:
+        # NudVertex colors are integers, so half float colors only ever hold byte values divided by 255
+        uv_type = COLOR_BYTE
+
+    return vertex_type, bone_type, uv_type
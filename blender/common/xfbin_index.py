@@ -0,0 +1,223 @@
+import mmap
+import struct
+from typing import Dict, List, Optional, Tuple
+
+NUCC_MAGIC = b'NUCC'
+
+# Magic, version, padding, chunk table size, min page size, version, unk
+NUCC_HEADER = struct.Struct('>4sI8xIIHH')
+
+# Type, path and name counts and sizes, chunk map count and size, chunk map indices count, extra indices count
+CHUNK_TABLE_HEADER = struct.Struct('>10I')
+
+# Size, chunk map index, version, unk
+CHUNK_HEADER = struct.Struct('>IIHH')
+
+# Page size, extra indices size
+PAGE_CHUNK = struct.Struct('>II')
+
+
+class XfbinChunkEntry:
+    """Location and identity of a single chunk inside an XFBIN file."""
+
+    def __init__(self, index: int, page: int, chunk_type: str, path: str, name: str, version: int, offset: int, size: int):
+        self.index = index
+        self.page = page
+
+        self.type = chunk_type
+        self.path = path
+        self.name = name
+        self.version = version
+
+        # Offset and size of the chunk's payload (after its header)
+        self.offset = offset
+        self.size = size
+
+    def __repr__(self):
+        return f'<{self.type} "{self.name}" ({self.path}) page={self.page} size={self.size}>'
+
+
+class XfbinPageEntry:
+    """Byte range of a single page inside an XFBIN file, and the range of its chunk map indices and references."""
+
+    def __init__(self, page: int, start: int, end: int, map_offset: int, map_count: int, extra_offset: int, extra_count: int):
+        self.page = page
+
+        # Offsets of the page's first chunk header and of the end of its page chunk
+        self.start = start
+        self.end = end
+
+        # Chunk map indices of the page's chunks, relative to which their chunk headers store their map index
+        self.map_offset = map_offset
+        self.map_count = map_count
+
+        # Chunk map references (extra indices) of the page
+        self.extra_offset = extra_offset
+        self.extra_count = extra_count
+
+
+def _read_strings(data, pos: int, count: int, size: int) -> List[str]:
+    strings = bytes(data[pos: pos + size]).split(b'\0')
+    return [s.decode('utf-8', 'replace') for s in strings[:count]]
+
+
+class XfbinIndex:
+    """Memory-mapped index of an XFBIN file.
+
+    Only the header, the chunk table and the chunk headers are read. Chunk payloads are not decoded,
+    and can be accessed as zero-copy memoryview slices of the mapped file with payload().
+    All payload views must be released before closing the index."""
+
+    chunk_types: List[str]
+    file_paths: List[str]
+    chunk_names: List[str]
+
+    # (type index, path index, name index) of each chunk map
+    chunk_maps: List[Tuple[int, int, int]]
+
+    # (chunk name index, chunk map index) of each chunk map reference
+    extra_indices: List[Tuple[int, int]]
+
+    chunks: List[XfbinChunkEntry]
+    page_entries: List[XfbinPageEntry]
+    page_count: int
+
+    def __init__(self, path: str, read_chunks=True, data: Optional[bytes] = None):
+        """Maps the file at path, or indexes data instead if it is given (path is then only used in error messages)."""
+
+        self.path = path
+
+        self._file = None
+        if data is not None:
+            self._mmap = data
+        else:
+            self._file = open(path, 'rb')
+            try:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped
+                self._file.close()
+                raise Exception(f'Invalid XFBIN file (empty): {path}')
+
+        try:
+            self._read_table()
+            self.chunks = list()
+            self.page_entries = list()
+            self.page_count = 0
+            if read_chunks:
+                self._read_chunks()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._mmap.close()
+            self._file.close()
+            self._file = None
+
+        self._mmap = None
+
+    def _read_table(self):
+        data = self._mmap
+
+        if len(data) < NUCC_HEADER.size + CHUNK_TABLE_HEADER.size:
+            raise Exception(f'Invalid XFBIN file (too small): {self.path}')
+
+        magic, self.version, self.chunk_table_size, _, _, _ = NUCC_HEADER.unpack_from(data, 0)
+        if magic != NUCC_MAGIC:
+            raise Exception(f'Invalid XFBIN file (wrong magic): {self.path}')
+
+        self.header = bytes(data[:NUCC_HEADER.size])
+
+        pos = NUCC_HEADER.size
+        (type_count, type_size, path_count, path_size, name_count, name_size,
+         map_count, _, map_indices_count, extra_indices_count) = CHUNK_TABLE_HEADER.unpack_from(data, pos)
+        pos += CHUNK_TABLE_HEADER.size
+
+        self.chunk_types = _read_strings(data, pos, type_count, type_size)
+        pos += type_size
+        self.file_paths = _read_strings(data, pos, path_count, path_size)
+        pos += path_size
+        self.chunk_names = _read_strings(data, pos, name_count, name_size)
+        pos += name_size
+
+        # The chunk maps are aligned to 4 bytes
+        pos = (pos + 3) & ~3
+
+        self.chunk_maps = list(struct.iter_unpack('>3I', data[pos: pos + map_count * 12]))
+        pos += map_count * 12
+
+        # Extra indices are pairs of u32
+        self.extra_indices = list(struct.iter_unpack('>2I', data[pos: pos + extra_indices_count * 8]))
+        pos += extra_indices_count * 8
+
+        self.chunk_map_indices = struct.unpack_from(f'>{map_indices_count}I', data, pos)
+
+        # The chunks start right after the chunk table, whose size includes any padding after the indices
+        self.chunks_offset = NUCC_HEADER.size + self.chunk_table_size
+
+    def chunk_map(self, map_index: int) -> Tuple[str, str, str]:
+        """Returns the (type, path, name) of a chunk map."""
+
+        type_index, path_index, name_index = self.chunk_maps[map_index]
+        return self.chunk_types[type_index], self.file_paths[path_index], self.chunk_names[name_index]
+
+    def _read_chunks(self):
+        data = self._mmap
+        end = len(data)
+        pos = self.chunks_offset
+
+        # Chunk map indices in chunk headers are relative to the start of the current page
+        page_map_offset = 0
+        page_extra_offset = 0
+        page_start = pos
+        page = 0
+
+        while pos + CHUNK_HEADER.size <= end:
+            size, map_index, version, _ = CHUNK_HEADER.unpack_from(data, pos)
+            pos += CHUNK_HEADER.size
+
+            if pos + size > end:
+                raise Exception(f'Invalid XFBIN file (chunk {len(self.chunks)} exceeds the file size): {self.path}')
+
+            chunk_type, path, name = self.chunk_map(self.chunk_map_indices[page_map_offset + map_index])
+            self.chunks.append(XfbinChunkEntry(len(self.chunks), page, chunk_type, path, name, version, pos, size))
+
+            if chunk_type == 'nuccChunkPage':
+                page_size, extra_size = PAGE_CHUNK.unpack_from(data, pos)
+                self.page_entries.append(XfbinPageEntry(page, page_start, pos + size,
+                                                        page_map_offset, page_size, page_extra_offset, extra_size))
+
+                page_map_offset += page_size
+                page_extra_offset += extra_size
+                page_start = pos + size
+                page += 1
+
+            pos += size
+
+        self.page_count = page
+
+    def payload(self, entry: XfbinChunkEntry) -> memoryview:
+        """Returns a zero-copy view of a chunk's payload."""
+        return memoryview(self._mmap)[entry.offset: entry.offset + entry.size]
+
+    def page_data(self, entry: XfbinPageEntry) -> memoryview:
+        """Returns a zero-copy view of a page's chunks, including their headers."""
+        return memoryview(self._mmap)[entry.start: entry.end]
+
+    def chunks_by_type(self, chunk_type: str) -> List[XfbinChunkEntry]:
+        return [c for c in self.chunks if c.type == chunk_type]
+
+    def pages(self) -> Dict[int, List[XfbinChunkEntry]]:
+        pages = dict()
+        for chunk in self.chunks:
+            pages.setdefault(chunk.page, list()).append(chunk)
+
+        return pages
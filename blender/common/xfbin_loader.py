@@ -0,0 +1,192 @@
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from ...xfbin_lib.xfbin.structure.nucc import NuccChunkClump, NuccChunkModel
+from ...xfbin_lib.xfbin.structure.nud import NudMesh
+from ...xfbin_lib.xfbin.structure.xfbin import Xfbin
+from ...xfbin_lib.xfbin.xfbin_reader import read_xfbin
+from .import_cache import XfbinImportCache, iter_nud_meshes, iter_nuds
+from .nud_arrays import NudMeshArrays
+from .nud_encoder import MAX_WINDOWS_WORKERS
+
+
+def selected_models(clump: NuccChunkClump, models_to_import: Optional[Set[str]]) -> List[NuccChunkModel]:
+    """Returns the models of the clump that should be imported. None means all of them."""
+
+    all_model_chunks = list(dict.fromkeys(
+        chain(clump.model_chunks, *map(lambda x: x.model_chunks, clump.model_groups))))
+
+    # Skip the models that were not selected, without converting their meshes
+    return [m for m in all_model_chunks if isinstance(m, NuccChunkModel) and m.nud and
+            (models_to_import is None or m.name in models_to_import)]
+
+
+def selected_meshes(xfbin: Xfbin, clumps_to_import: Optional[Set[str]], models_to_import: Optional[Set[str]]) -> Iterator[NudMesh]:
+    """Yields the NUD meshes that will be imported, in the order they will be created."""
+
+    for page in xfbin.pages:
+        for clump in page.get_chunks_by_type('nuccChunkClump'):
+            if clumps_to_import is not None and clump.name not in clumps_to_import:
+                continue
+
+            for model in selected_models(clump, models_to_import):
+                for group in model.nud.mesh_groups:
+                    yield from group.meshes
+
+
+class LoadedXfbin:
+    """An XFBIN parsed for importing, with the arrays of the meshes that will be imported.
+    Meshes and NUDs are referred to by their index in iter_nud_meshes and iter_nuds order, as their ids change
+    when the result is sent back from a worker process."""
+
+    def __init__(self, xfbin: Xfbin, mesh_arrays: Dict[int, NudMeshArrays], decode_errors: Dict[int, str],
+                 bone_ranges: List[Tuple[int, int]], stripped: bool, cache_error: Optional[str], load_time: float):
+        self.xfbin = xfbin
+        self.mesh_arrays = mesh_arrays
+
+        # Meshes that could not be decoded, with the error message
+        self.decode_errors = decode_errors
+
+        # Bone range of each NUD. They are computed from the vertices, so they are stored before the geometry is stripped
+        self.bone_ranges = bone_ranges
+
+        # Whether the vertices and faces of the NUD meshes were removed, to send the result back from a worker quickly.
+        # The file has to be read again to build a mesh without its arrays
+        self.stripped = stripped
+
+        self.cache_error = cache_error
+        self.load_time = load_time
+
+
+def load_xfbin(path: str, decode: bool, clumps_to_import: Optional[Set[str]], models_to_import: Optional[Set[str]],
+               import_cache: Optional[XfbinImportCache], addon_version: Tuple[int, ...], strip_geometry: bool) -> LoadedXfbin:
+    """Parses an XFBIN and decodes the meshes that will be imported (if decode is set), using and updating the import cache.
+    Does not use bpy, so it can run in a worker process."""
+
+    start_time = time.perf_counter()
+
+    xfbin = read_xfbin(path)
+    meshes = list(iter_nud_meshes(xfbin))
+
+    cache_key = None
+    cached = dict()
+    if decode and import_cache:
+        cache_key = import_cache.key(path, addon_version)
+        cached = import_cache.load(cache_key, len(meshes))
+
+    mesh_indices = {id(m): i for i, m in enumerate(meshes)}
+    mesh_arrays = dict()
+    decode_errors = dict()
+
+    if decode:
+        for mesh in selected_meshes(xfbin, clumps_to_import, models_to_import):
+            i = mesh_indices[id(mesh)]
+            if i in mesh_arrays or i in decode_errors:
+                continue
+
+            if i in cached:
+                mesh_arrays[i] = cached[i]
+                continue
+
+            try:
+                mesh_arrays[i] = NudMeshArrays(mesh)
+            except Exception as e:
+                decode_errors[i] = str(e)
+
+    # Store the arrays of the newly decoded meshes, along with the ones that were already cached.
+    # Meshes that are not imported are not decoded just for the cache
+    cache_error = None
+    if cache_key and any(i not in cached for i in mesh_arrays):
+        try:
+            import_cache.save(cache_key, len(meshes), {**cached, **mesh_arrays})
+        except Exception as e:
+            cache_error = str(e)
+
+    bone_ranges = [nud.get_bone_range() for nud in iter_nuds(xfbin)]
+
+    if strip_geometry:
+        for mesh in meshes:
+            mesh.vertices = list()
+            mesh.faces = list()
+
+    return LoadedXfbin(xfbin, mesh_arrays, decode_errors, bone_ranges, strip_geometry, cache_error,
+                       time.perf_counter() - start_time)
+
+
+class XfbinLoader:
+    """Runs load_xfbin in a process pool, so files are parsed and decoded while blender creates the data of the previous ones.
+    The parsing is pure Python, so threads could not run it alongside blender's main thread.
+    With no workers, or if the pool fails, the files are loaded in this process when their result is needed."""
+
+    def __init__(self, workers: int = 0, executable: str = None):
+        # Windows can't wait on more than 61 processes, and more workers than CPUs don't help anyway
+        max_workers = min(os.cpu_count() or 1, MAX_WINDOWS_WORKERS if sys.platform == 'win32' else math.inf)
+        self.workers = max(0, min(workers, max_workers))
+
+        self.executable = executable
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+        # The exception that made the loader fall back to loading in this process, if any
+        self.error: Optional[Exception] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+
+    def submit(self, *args) -> Tuple[Optional[Future], tuple]:
+        """Starts loading a file in a worker, with the arguments of load_xfbin (except strip_geometry).
+        Returns a task to pass to result()."""
+
+        if self.workers:
+            try:
+                if not self.executor:
+                    # Spawn the workers instead of forking blender's process
+                    mp_context = multiprocessing.get_context('spawn')
+                    if self.executable:
+                        mp_context.set_executable(self.executable)
+
+                    self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp_context)
+
+                return self.executor.submit(load_xfbin, *args, True), args
+            except Exception as e:
+                self.fail(e)
+
+        return None, args
+
+    def result(self, task: Tuple[Optional[Future], tuple]) -> LoadedXfbin:
+        """Returns the loaded file, loading it in this process if it was not submitted to a worker.
+        Errors in the file itself are raised."""
+
+        future, args = task
+        error = None
+        if future is not None:
+            try:
+                return future.result()
+            except Exception as e:
+                error = e
+
+        loaded = load_xfbin(*args, False)
+
+        if error is not None:
+            # The file loads in this process, so the worker failed for another reason (like a broken pool)
+            self.fail(error)
+
+        return loaded
+
+    def fail(self, error: Exception):
+        self.error = error
+        self.close()
+        self.workers = 0
@@ -0,0 +1,102 @@
+import struct
+from typing import Dict, List, Tuple
+
+from .xfbin_index import CHUNK_TABLE_HEADER, NUCC_HEADER, XfbinIndex
+
+
+def content_page_offset(index: XfbinIndex, page_count: int) -> int:
+    """Returns the number of pages that come before the XFBIN's page_count content pages in the index
+    (like the initial index page the writer adds), or -1 if the pages can't be matched to them."""
+
+    offset = index.page_count - page_count
+
+    # Chunks after the last page chunk don't belong to any page, so they can't be copied with one
+    if offset < 0 or (index.chunks and index.chunks[-1].page >= index.page_count):
+        return -1
+
+    return offset
+
+
+class ChunkTableBuilder:
+    """Collects the type, path and name tables, the chunk maps and the chunk map indices and references of spliced pages.
+    Each string and chunk map is added once, in the order they are first used in."""
+
+    def __init__(self):
+        self.chunk_types: Dict[str, int] = dict()
+        self.file_paths: Dict[str, int] = dict()
+        self.chunk_names: Dict[str, int] = dict()
+        self.chunk_maps: Dict[Tuple[int, int, int], int] = dict()
+
+        self.chunk_map_indices: List[int] = list()
+        self.extra_indices: List[Tuple[int, int]] = list()
+
+    @staticmethod
+    def add_item(items: dict, item) -> int:
+        return items.setdefault(item, len(items))
+
+    def add_chunk_map(self, index: XfbinIndex, map_index: int) -> int:
+        chunk_type, path, name = index.chunk_map(map_index)
+        return self.add_item(self.chunk_maps, (self.add_item(self.chunk_types, chunk_type),
+                                               self.add_item(self.file_paths, path),
+                                               self.add_item(self.chunk_names, name)))
+
+    def add_page(self, index: XfbinIndex, page: int):
+        entry = index.page_entries[page]
+
+        # The chunks' headers and payloads refer to chunk maps relative to their page, so only the page's
+        # chunk map indices have to be remapped. The order and count of each page's indices stay the same
+        for map_index in index.chunk_map_indices[entry.map_offset: entry.map_offset + entry.map_count]:
+            self.chunk_map_indices.append(self.add_chunk_map(index, map_index))
+
+        for name_index, map_index in index.extra_indices[entry.extra_offset: entry.extra_offset + entry.extra_count]:
+            self.extra_indices.append((self.add_item(self.chunk_names, index.chunk_names[name_index]),
+                                       self.add_chunk_map(index, map_index)))
+
+    def write(self) -> bytes:
+        def strings(items: Dict[str, int]) -> bytes:
+            return b''.join(s.encode('utf-8') + b'\0' for s in items)
+
+        types, paths, names = strings(self.chunk_types), strings(self.file_paths), strings(self.chunk_names)
+
+        table = bytearray(CHUNK_TABLE_HEADER.pack(
+            len(self.chunk_types), len(types), len(self.file_paths), len(paths), len(self.chunk_names), len(names),
+            len(self.chunk_maps), len(self.chunk_maps) * 12, len(self.chunk_map_indices), len(self.extra_indices)))
+
+        table += types + paths + names
+
+        # The chunk maps are aligned to 4 bytes. The NUCC header's size is a multiple of 4 as well
+        table += bytes(-len(table) % 4)
+
+        for chunk_map in self.chunk_maps:
+            table += struct.pack('>3I', *chunk_map)
+
+        for extra in self.extra_indices:
+            table += struct.pack('>2I', *extra)
+
+        table += struct.pack(f'>{len(self.chunk_map_indices)}I', *self.chunk_map_indices)
+
+        return bytes(table)
+
+
+def splice_xfbin(header: bytes, pages: List[Tuple[XfbinIndex, int]]) -> bytearray:
+    """Writes an XFBIN made of existing pages of indexed XFBINs, in the given order, without decoding them.
+
+    Each page's chunks are copied as a single byte range, and only the chunk table is rebuilt. Pages that were
+    serialized by the same writer therefore come out exactly as a full rewrite would write them.
+    header is the NUCC header to use (its chunk table size is replaced)."""
+
+    builder = ChunkTableBuilder()
+    for index, page in pages:
+        builder.add_page(index, page)
+
+    table = builder.write()
+
+    data = bytearray(header[:NUCC_HEADER.size])
+    magic, version, _, min_page_size, version2, unk = NUCC_HEADER.unpack(data)
+    NUCC_HEADER.pack_into(data, 0, magic, version, len(table), min_page_size, version2, unk)
+
+    data += table
+    for index, page in pages:
+        data += index.page_data(index.page_entries[page])
+
+    return data
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Set
+
+from .xfbin_index import XfbinIndex
+
+
+class XfbinTocPage:
+    """Names of the clumps, models and textures in a single page of an XFBIN."""
+
+    def __init__(self, clumps: List[str] = None, models: List[str] = None, textures: List[List[str]] = None):
+        self.clumps = clumps or list()
+        self.models = models or list()
+
+        # (path, name) of each texture chunk
+        self.textures = textures or list()
+
+    def to_dict(self) -> dict:
+        return {'clumps': self.clumps, 'models': self.models, 'textures': self.textures}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'XfbinTocPage':
+        return cls(d['clumps'], d['models'], d['textures'])
+
+
+class XfbinToc:
+    """Table of contents of an XFBIN file, read from its chunk table and chunk headers only."""
+
+    def __init__(self, pages: List[XfbinTocPage]):
+        self.pages = pages
+
+    @property
+    def clumps(self) -> List[str]:
+        return [c for p in self.pages for c in p.clumps]
+
+    @property
+    def models(self) -> List[str]:
+        return [m for p in self.pages for m in p.models]
+
+    @property
+    def textures(self) -> List[List[str]]:
+        return [t for p in self.pages for t in p.textures]
+
+    def to_dict(self) -> dict:
+        return {'pages': [p.to_dict() for p in self.pages]}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'XfbinToc':
+        return cls([XfbinTocPage.from_dict(p) for p in d['pages']])
+
+
+def read_xfbin_toc(path: str) -> XfbinToc:
+    pages: Dict[int, XfbinTocPage] = dict()
+
+    with XfbinIndex(path) as index:
+        for chunk in index.chunks:
+            page = pages.setdefault(chunk.page, XfbinTocPage())
+
+            if chunk.type == 'nuccChunkClump':
+                page.clumps.append(chunk.name)
+            elif chunk.type == 'nuccChunkModel':
+                page.models.append(chunk.name)
+            elif chunk.type == 'nuccChunkTexture':
+                page.textures.append([chunk.path, chunk.name])
+
+    # Skip the empty trailing page that may be created after the last page chunk
+    return XfbinToc([pages[i] for i in sorted(pages) if pages[i].clumps or pages[i].models or pages[i].textures])
+
+
+class XfbinTocCache:
+    """Sidecar index of XFBIN tables of contents, keyed by file path, size and modification time.
+    Each directory has its own sidecar file in cache_dir, which is only loaded when a file in it is browsed,
+    so large directories never evict each other's entries."""
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir
+
+        # Entries of each loaded directory, by file name
+        self.directories: Dict[str, Dict[str, dict]] = dict()
+        self.modified: Set[str] = set()
+
+    def sidecar_path(self, directory: str) -> str:
+        name = hashlib.sha1(os.path.normcase(directory).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{name}.json')
+
+    def directory_entries(self, directory: str) -> Dict[str, dict]:
+        entries = self.directories.get(directory)
+        if entries is not None:
+            return entries
+
+        entries = dict()
+        if self.cache_dir and os.path.isfile(self.sidecar_path(directory)):
+            try:
+                with open(self.sidecar_path(directory), 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except Exception:
+                # A corrupted index is simply rebuilt
+                entries = dict()
+
+        self.directories[directory] = entries
+        return entries
+
+    def get(self, path: str) -> XfbinToc:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+
+        directory, name = os.path.split(path)
+        entries = self.directory_entries(directory)
+
+        entry = entries.get(name)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return XfbinToc.from_dict(entry['toc'])
+
+        toc = read_xfbin_toc(path)
+        entries[name] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'toc': toc.to_dict()}
+        self.modified.add(directory)
+
+        return toc
+
+    def save(self):
+        if not self.cache_dir:
+            return
+
+        for directory in self.modified:
+            entries = self.directories[directory]
+
+            # Drop the entries of files that no longer exist
+            if os.path.isdir(directory):
+                files = set(os.listdir(directory))
+                entries = {k: v for k, v in entries.items() if k in files}
+            else:
+                entries = dict()
+
+            self.directories[directory] = entries
+
+            sidecar_path = self.sidecar_path(directory)
+            if not entries:
+                if os.path.isfile(sidecar_path):
+                    os.remove(sidecar_path)
+                continue
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(sidecar_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+
+        self.modified.clear()
@@ -1,14 +1,16 @@
 import os
+import sys
+from collections import Counter
 from functools import reduce
 from itertools import chain
 from os import path
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 import bpy
+import numpy as np
 from bpy.props import (BoolProperty, CollectionProperty, EnumProperty,
-                       StringProperty)
-from bpy.types import (Armature, EditBone, Mesh, MeshLoop, MeshLoopTriangle,
-                       MeshVertex, Object, Operator)
+                       FloatProperty, IntProperty, StringProperty)
+from bpy.types import Armature, EditBone, Mesh, Object, Operator
 from bpy_extras.io_utils import ExportHelper
 from mathutils import Matrix, Vector
 
@@ -23,13 +25,25 @@ from ..xfbin_lib.xfbin.structure.nucc import (ClumpModelGroup, CoordNode,
 from ..xfbin_lib.xfbin.structure.nud import (Nud, NudMaterial,
                                              NudMaterialProperty,
                                              NudMaterialTexture, NudMesh,
-                                             NudMeshGroup, NudVertex)
+                                             NudMeshGroup)
 from ..xfbin_lib.xfbin.structure.xfbin import Xfbin
-from ..xfbin_lib.xfbin.util.iterative_dict import IterativeDict
 from ..xfbin_lib.xfbin.xfbin_reader import read_xfbin
-from ..xfbin_lib.xfbin.xfbin_writer import write_xfbin_to_path
+from ..xfbin_lib.xfbin.xfbin_writer import write_xfbin, write_xfbin_to_path
+from .common.bounding_spheres import nud_bounding_sphere
 from .common.coordinate_converter import *
-from .common.helpers import XFBIN_TEXTURES_OBJ, hex_str_to_int
+from .common.helpers import (PYTHON_EXECUTABLE, XFBIN_TEXTURES_OBJ,
+                             foreach_get_array, hex_str_to_int)
+from .common.mesh_cache import CACHE_VERSION, EncodedMeshCache, hash_items
+from .common.nud_arrays import (pos_scaled_from_blender_array,
+                                transform_directions, transform_normals,
+                                transform_points, uv_from_blender_array)
+from .common.nud_encoder import (EncodedNudMeshes, NudMeshEncoder, NudMeshJob,
+                                 NudMeshWeights)
+from .common.nud_vertices import NudVertexColumns, vertex_format_dtypes
+from .common.triangle_strips import strip_index_count
+from .common.vertex_quantization import QuantizationTolerances
+from .common.xfbin_index import XfbinIndex
+from .common.xfbin_splice import content_page_offset, splice_xfbin
 from .panels.clump_panel import (ClumpModelGroupPropertyGroup,
                                  ClumpPropertyGroup,
                                  XfbinMaterialPropertyGroup,
@@ -45,6 +59,10 @@ from .panels.texture_chunks_panel import (TextureChunksListPropertyGroup,
                                           XfbinTextureChunkPropertyGroup)
 
 
+# Encoded NUD meshes from previous exports, kept for the whole session
+ENCODED_MESH_CACHE = EncodedMeshCache()
+
+
 class ExportXfbin(Operator, ExportHelper):
     """Export current collection as XFBIN file"""
     bl_idname = 'export_scene.xfbin'
@@ -134,6 +152,81 @@ class ExportXfbin(Operator, ExportHelper):
         type=BoolPropertyGroup,
     )
 
+    worker_count: IntProperty(
+        name='Worker processes',
+        description='Number of processes used to encode the NUD meshes after they are extracted from blender.\n'
+        'If 1, all meshes will be encoded on blender\'s main thread. Small exports are always encoded on the main thread.\n'
+        'Limited to the number of CPUs (and to 61 on Windows)',
+        min=1,
+        default=os.cpu_count() or 1,
+    )
+
+    split_large_meshes: BoolProperty(
+        name='Split large meshes',
+        description='Split meshes that exceed the vertex or face limit of a NUD mesh into several meshes in the same NUD.\n'
+        'If disabled, these meshes will be skipped',
+        default=True,
+    )
+
+    optimize_vertex_cache: BoolProperty(
+        name='Optimize vertex cache',
+        description='Reorder the faces and vertices of each mesh for the GPU\'s vertex cache, so the models render faster.\n'
+        'This makes exporting slower, and changes the drawing order of the faces',
+        default=False,
+    )
+
+    update_bounding_spheres: BoolProperty(
+        name='Update bounding spheres',
+        description='Compute the bounding spheres of each NUD and mesh group from the exported vertices, in the current pose.\n'
+        'The last 4 values of the mesh group are kept from the NUD properties.\n'
+        'If disabled, the bounding spheres in the NUD properties will be used',
+        default=True,
+    )
+
+    auto_quantize: BoolProperty(
+        name='Compact vertex formats',
+        description='Store the normals and bone weights of each mesh in the smallest format (half float or byte) '
+        'that keeps them within the tolerances below, and the colors in bytes.\n'
+        'The formats set in the mesh properties are never replaced by larger ones',
+        default=False,
+    )
+
+    normal_tolerance: FloatProperty(
+        name='Normal tolerance',
+        description='Largest error allowed per component of the normals, tangents and bitangents',
+        min=0.0,
+        default=0.001,
+        precision=4,
+    )
+
+    weight_tolerance: FloatProperty(
+        name='Weight tolerance',
+        description='Largest error allowed per bone weight',
+        min=0.0,
+        default=0.005,
+        precision=4,
+    )
+
+
+    use_mesh_cache: BoolProperty(
+        name='Reuse unchanged meshes',
+        description='If True, meshes that did not change since a previous export in this session will reuse their encoded data',
+        default=True,
+    )
+
+    persist_mesh_cache: BoolProperty(
+        name='Save mesh cache',
+        description='If True, the encoded meshes will also be saved next to the .blend file, to be reused after reopening it',
+        default=False,
+    )
+
+    mesh_cache_size: IntProperty(
+        name='Mesh cache size (MB)',
+        description='Maximum size of the mesh cache. The least recently used meshes are removed first',
+        min=1,
+        default=512,
+    )
+
     def draw(self, context):
         layout = self.layout
 
@@ -155,6 +248,22 @@ class ExportXfbin(Operator, ExportHelper):
 
         layout.prop(self, 'inject_to_clump')
 
+        layout.prop(self, 'worker_count')
+
+        layout.prop(self, 'split_large_meshes')
+        layout.prop(self, 'optimize_vertex_cache')
+        layout.prop(self, 'update_bounding_spheres')
+
+        layout.prop(self, 'auto_quantize')
+        if self.auto_quantize:
+            layout.prop(self, 'normal_tolerance')
+            layout.prop(self, 'weight_tolerance')
+
+        layout.prop(self, 'use_mesh_cache')
+        if self.use_mesh_cache:
+            layout.prop(self, 'persist_mesh_cache')
+            layout.prop(self, 'mesh_cache_size')
+
         layout.prop(self, 'export_specific_meshes')
 
         if self.export_specific_meshes:
@@ -207,16 +316,55 @@ class XfbinExporter:
         self.inject_to_clump = export_settings.get('inject_to_clump')
         self.export_specific_meshes = export_settings.get('export_specific_meshes')
         self.meshes_to_export = export_settings.get('meshes_to_export')
+        self.worker_count = export_settings.get('worker_count', 1)
+
+        self.split_large_meshes = export_settings.get('split_large_meshes', False)
+        self.optimize_vertex_cache = export_settings.get('optimize_vertex_cache', False)
+        self.update_bounding_spheres = export_settings.get('update_bounding_spheres', False)
+        self.auto_quantize = export_settings.get('auto_quantize', False)
+        self.normal_tolerance = export_settings.get('normal_tolerance', 0.001)
+        self.weight_tolerance = export_settings.get('weight_tolerance', 0.005)
+        self.use_mesh_cache = export_settings.get('use_mesh_cache', False)
+        self.persist_mesh_cache = export_settings.get('persist_mesh_cache', False)
+        self.mesh_cache_size = export_settings.get('mesh_cache_size', 512)
 
     xfbin: Xfbin
+    encoder: NudMeshEncoder
 
     def export_collection(self, context):
+        # The meshes of all clumps are encoded by the same encoder, so its worker processes are only started once
+        with NudMeshEncoder(self.worker_count, PYTHON_EXECUTABLE) as self.encoder:
+            self.export_xfbin(context)
+
+        if self.encoder.error:
+            self.operator.report(
+                {'WARNING'}, f'Encoding the meshes in worker processes failed, they were encoded on the main thread instead: {self.encoder.error}')
+
+    def export_xfbin(self, context):
+        # Statistics of all encoded meshes, reported after exporting
+        self.encoding_stats = Counter()
+
+        if self.use_mesh_cache:
+            ENCODED_MESH_CACHE.max_size = self.mesh_cache_size * 1024 * 1024
+            ENCODED_MESH_CACHE.reset_stats()
+
+            cache_path = self.mesh_cache_path()
+            if cache_path and not len(ENCODED_MESH_CACHE):
+                ENCODED_MESH_CACHE.load(cache_path)
+
         self.xfbin = Xfbin()
+
+        # Pages of the existing XFBIN, and the ids of the ones that were modified in place,
+        # so the untouched pages can be copied from the existing file when writing it
+        self.original_pages = list()
+        self.modified_pages = set()
+
         if self.inject_to_xfbin:
             if not path.isfile(self.filepath):
                 raise Exception(f'Cannot inject XFBIN - File does not exist: {self.filepath}')
 
             self.xfbin = read_xfbin(self.filepath)
+            self.original_pages = list(self.xfbin.pages)
         else:
             self.export_meshes = self.export_bones = self.export_textures = True
             self.inject_to_clump = False
@@ -248,6 +396,7 @@ class XfbinExporter:
                             continue
 
                         self.xfbin.add_chunk_page(chunk)
+                        self.mark_page_modified(chunk)
 
         # Export clumps
         for armature_obj in [obj for obj in self.collection.objects if obj.type == 'ARMATURE']:
@@ -256,11 +405,14 @@ class XfbinExporter:
 
             if not self.inject_to_clump:
                 self.xfbin.add_clump_page(clump)
+                self.mark_page_modified(clump)
             else:
                 # Try to get the clump in the existing xfbin
                 old_clump = self.xfbin.get_chunk_page(clump)
 
                 if old_clump:
+                    self.mark_page_modified(clump)
+
                     # There should be only 1 clump per page anyway
                     old_clump: NuccChunkClump = old_clump[1].get_chunks_by_type(NuccChunkClump)[0]
                 else:
@@ -301,7 +453,104 @@ class XfbinExporter:
                             model.copy_from(new_model)
 
         # Write the xfbin
-        write_xfbin_to_path(self.xfbin, self.filepath)
+        self.write_xfbin()
+
+        if self.use_mesh_cache:
+            cache_path = self.mesh_cache_path()
+            if cache_path:
+                ENCODED_MESH_CACHE.save(cache_path)
+
+            if ENCODED_MESH_CACHE.hits or ENCODED_MESH_CACHE.misses:
+                self.operator.report(
+                    {'INFO'}, f'Mesh cache: {ENCODED_MESH_CACHE.hits} reused, {ENCODED_MESH_CACHE.misses} encoded')
+
+        self.report_encoding_stats()
+
+    def report_encoding_stats(self):
+        stats = self.encoding_stats
+        faces, vertices = stats['faces'], stats['vertices']
+
+        if self.optimize_vertex_cache and faces:
+            before, after = stats['cache_misses_before'], stats['cache_misses_after']
+            self.operator.report(
+                {'INFO'}, f'Vertex cache: ACMR {before / faces:.3f} -> {after / faces:.3f}, '
+                f'ATVR {before / vertices:.3f} -> {after / vertices:.3f}')
+
+        if stats['list_indices']:
+            before, after = stats['list_indices'], stats['strip_indices']
+            self.operator.report(
+                {'INFO'}, f'Triangle strips: {before} -> {after} indices ({(before - after) * 2} bytes saved)')
+
+        if self.auto_quantize and stats['vertex_bytes_before']:
+            before, after = stats['vertex_bytes_before'], stats['vertex_bytes_after']
+            self.operator.report(
+                {'INFO'}, f'Compact vertex formats: {before} -> {after} vertex bytes ({before - after} bytes saved, '
+                f'{stats["quantized_meshes"]} meshes changed)')
+
+    def mark_page_modified(self, chunk):
+        page = self.xfbin.get_chunk_page(chunk)
+        if page:
+            self.modified_pages.add(id(page[1]))
+        else:
+            # The page can't be told apart from the untouched ones, so the whole XFBIN has to be rewritten
+            self.original_pages = list()
+
+    def write_xfbin(self):
+        """Writes the XFBIN. When injecting, the pages that were not modified are copied from the existing file
+        instead of being serialized again, and only the modified pages and the chunk table are written."""
+
+        data = self.splice_pages() if self.original_pages else None
+
+        if data is None:
+            write_xfbin_to_path(self.xfbin, self.filepath)
+            return
+
+        with open(self.filepath, 'wb') as f:
+            f.write(data)
+
+    def splice_pages(self) -> Optional[bytearray]:
+        """Splices the untouched pages of the existing file with the modified pages.
+        Returns None if there is nothing to reuse, or if the pages of the existing file can't be matched."""
+
+        pages = self.xfbin.pages
+        original = self.original_pages
+
+        # Pages that were replaced, added, or modified in place
+        modified = [p for i, p in enumerate(pages)
+                    if i >= len(original) or p is not original[i] or id(p) in self.modified_pages]
+
+        if len(modified) == len(pages):
+            return None
+
+        # Only serialize the modified pages
+        modified_xfbin = Xfbin()
+        modified_xfbin.pages = modified
+
+        with XfbinIndex(self.filepath) as existing, XfbinIndex(self.filepath, data=write_xfbin(modified_xfbin)) as serialized:
+            existing_offset = content_page_offset(existing, len(original))
+            serialized_offset = content_page_offset(serialized, len(modified))
+            if existing_offset < 0 or serialized_offset < 0:
+                return None
+
+            # The header and the leading pages are the writer's own, like in a full rewrite
+            sources = [(serialized, i) for i in range(serialized_offset)]
+
+            modified_ids = {id(p): i for i, p in enumerate(modified)}
+            for i, page in enumerate(pages):
+                if id(page) in modified_ids:
+                    sources.append((serialized, serialized_offset + modified_ids[id(page)]))
+                else:
+                    sources.append((existing, existing_offset + i))
+
+            return splice_xfbin(serialized.header, sources)
+
+    def mesh_cache_path(self) -> str:
+        """Returns the path of the persisted mesh cache next to the .blend file, or None if it should not be persisted."""
+
+        if not (self.persist_mesh_cache and bpy.data.filepath):
+            return None
+
+        return f'{bpy.data.filepath}.xfbin_cache.npz'
 
     def make_clump(self, armature_obj: Object, context) -> NuccChunkClump:
         """Creates and returns a NuccChunkClump made from an Armature and its child meshes."""
@@ -437,6 +686,9 @@ class XfbinExporter:
     def make_models(self, empties: List[Object], clump: NuccChunkClump, old_clump: NuccChunkClump, xfbin_mats: Dict[str, NuccChunkMaterial], context) -> List[NuccChunkModel]:
         bpy.ops.object.mode_set(mode='OBJECT')
 
+        # All meshes are evaluated from the same depsgraph
+        depsgraph = context.evaluated_depsgraph_get()
+
         model_chunks = list()
 
         coord_indices_dict = {
@@ -448,6 +700,10 @@ class XfbinExporter:
         old_clump_all_models = list(dict.fromkeys(
             chain(old_clump.model_chunks, *old_clump.model_groups))) if old_clump else None
 
+        # The meshes of all models are extracted from blender first, then encoded together (in parallel if enabled)
+        # Each item is (empty, model chunk, list of (mesh object, mesh properties, job)), or (empty, old model chunk, None)
+        extracted_models = list()
+
         for empty in empties:
             if self.export_specific_meshes:
                 # Use existing models from the old clump if the current model is not supposed to be exported
@@ -459,7 +715,7 @@ class XfbinExporter:
                     if old_clump:
                         old_model = [c for c in old_clump_all_models if c and c.name == empty.name]
                         if old_model:
-                            model_chunks.append(old_model[0])
+                            extracted_models.append((empty, old_model[0], None))
                     continue
 
             nud_data: NudPropertyGroup = empty.xfbin_nud_data
@@ -505,170 +761,275 @@ class XfbinExporter:
             mesh_bone = armature.bones.get(nud_data.mesh_bone)
             empty_parent_type = empty.parent_type
 
+            extracted_meshes = list()
+
             # Sort the meshes alphabetically (because we made sure they imported in that order)
             for mesh_obj in sorted([c for c in empty.children if c.type == 'MESH'], key=lambda x: x.name):
                 mesh_obj: Object
 
-                context.view_layer.objects.active = mesh_obj
-                bpy.ops.object.mode_set(mode='OBJECT')
-
-                # Generate a mesh with modifiers applied, and put it into a bmesh
-                mesh: Mesh = mesh_obj.evaluated_get(context.evaluated_depsgraph_get()).data
+                mesh_data: NudMeshPropertyGroup = mesh_obj.xfbin_mesh_data
 
-                # Transform the mesh by the inverse of its bone's matrix, if it was not parented to it
-                if mesh_bone and empty_parent_type != 'BONE':
-                    mesh.transform(mesh_bone.matrix_local.to_4x4().inverted())
-
-                mesh.calc_normals_split()
-                mesh.calc_tangents()
-                mesh.calc_loop_triangles()
-
-                faces = [None] * len(mesh.loop_triangles)
-                face_index = 0
-                vertices = [None] * len(mesh.loop_triangles)
-                vertex_index = 0
-
-                mesh_vertices = mesh.vertices
-                mesh_loops = mesh.loops
-
-                # Get the vertex groups
-                v_groups = mesh_obj.vertex_groups
-
-                color_layer = None
-                if len(mesh.vertex_colors):
-                    color_layer = mesh.vertex_colors[0].data
-
-                uv_layer1 = None
-                uv_layer2 = None
-                if len(mesh.uv_layers):
-                    uv_layer1 = mesh.uv_layers[0].data
-                if len(mesh.uv_layers) > 1:
-                    uv_layer2 = mesh.uv_layers[1].data
-
-                for tri_loops in mesh.loop_triangles:
-                    tri_loops: MeshLoopTriangle
-
-                    verts = vertices[vertex_index] = list()
-                    vertex_index += 1
-
-                    for l_index in tri_loops.loops:
-                        l: MeshLoop = mesh_loops[l_index]
-                        v_index = l.vertex_index
-                        v: MeshVertex = mesh_vertices[v_index]
-
-                        # Create and add the vertex
-                        vert = NudVertex()
-                        verts.append(vert)
-
-                        # Position and normal, tangent, bitangent
-                        vert.position = pos_scaled_from_blender(v.co)
-                        vert.normal = pos_from_blender(l.normal)
-                        vert.tangent = pos_from_blender(l.tangent)
-                        vert.bitangent = l.bitangent_sign * Vector(vert.normal).cross(Vector(vert.tangent))
-
-                        # Color
-                        vert.color = tuple()
-                        if color_layer:
-                            vert.color = tuple(map(lambda x: int(x * 255), color_layer[l_index].color))
-
-                        # UV
-                        vert.uv = list()
-                        if uv_layer1:
-                            vert.uv.append(uv_from_blender(uv_layer1[l_index].uv))
-                        if uv_layer2:
-                            vert.uv.append(uv_from_blender(uv_layer2[l_index].uv))
-
-                        vert.bone_ids = tuple()
-                        vert.bone_weights = tuple()
-
-                        # Bone indices and weights
-                        # Direct copy of TheTurboTurnip's weight sorting method
-                        # https://github.com/theturboturnip/yk_gmd_io/blob/master/yk_gmd_blender/blender/export/legacy/exporter.py#L302-L316
-
-                        # Get a list of (vertex group ID, weight) items sorted in descending order of weight
-                        # Take the top 4 elements, for the top 4 most deforming bones
-                        # Normalize the weights so they sum to 1
-                        b_weights = [(v_groups[g.group].name, g.weight) for g in sorted(
-                            v.groups, key=lambda g: 1 - g.weight) if v_groups[g.group].name in coord_indices_dict]
-                        if len(b_weights) > 4:
-                            b_weights = b_weights[:4]
-                        elif len(b_weights) < 4:
-                            # Add zeroed elements to b_weights so it's 4 elements long
-                            b_weights += [(0, 0.0)] * (4 - len(b_weights))
-
-                        weight_sum = sum(weight for (_, weight) in b_weights)
-                        if weight_sum > 0.0:
-                            vert.bone_ids = tuple(map(lambda bw: coord_indices_dict.get(bw[0], 0), b_weights))
-                            vert.bone_weights = tuple(map(lambda bw: bw[1] / weight_sum, b_weights))
-                        else:
-                            vert.bone_ids = [0] * 4
-                            vert.bone_weights = [0] * 3 + [1]
-
-                vertices_dict = IterativeDict()
-                vertices_dict_get = vertices_dict.get_or_next
-                for verts in vertices:
-                    # Get the vertex indices to make the face
-                    faces[face_index] = tuple(map(lambda x: vertices_dict_get(x), verts))
-                    face_index += 1
-
-                vertices = list(vertices_dict)
-
-                # Free the mesh data after we're done with it
-                mesh.free_normals_split()
-                mesh.free_tangents()
-
-                if len(vertices) < 3:
+                # Skip meshes without a material before doing any work on them
+                if xfbin_mats.get(mesh_data.xfbin_material) is None:
                     self.operator.report(
-                        {'WARNING'}, f'[NUD MESH] {mesh_obj.name} has no valid faces and will be skipped.')
+                        {'WARNING'}, f'[NUD MESH] {mesh_obj.name} has a non-existing XFBIN material and will be skipped.')
                     continue
 
-                if len(vertices) > NudMesh.MAX_VERTICES:
-                    self.operator.report(
-                        {'WARNING'}, f'[NUD MESH] {mesh_obj.name} has {len(vertices)} vertices (limit is {NudMesh.MAX_VERTICES}) and will be skipped.')
-                    continue
+                # The vertices are transformed by the inverse of the mesh bone's matrix, if the mesh was not parented to it
+                matrix = None
+                if mesh_bone and empty_parent_type != 'BONE':
+                    matrix = np.array(mesh_bone.matrix_local.to_4x4().inverted(), dtype=np.float32)
+
+                # Only the attributes that the mesh's formats store will be computed and extracted
+                vertex_formats = (int(mesh_data.vertex_type), int(mesh_data.bone_type), int(mesh_data.uv_type))
+                vertex_dtypes = vertex_format_dtypes(*vertex_formats)
+
+                # Generate a temporary mesh with modifiers applied. It is freed right after extracting it,
+                # so only one evaluated mesh exists at a time, and the depsgraph's own data is never modified
+                evaluated_obj = mesh_obj.evaluated_get(depsgraph)
+                mesh: Mesh = evaluated_obj.to_mesh()
+
+                try:
+                    if 'tangent' in vertex_dtypes and not len(mesh.uv_layers):
+                        self.operator.report(
+                            {'WARNING'}, f'[NUD MESH] {mesh_obj.name} has no UV map, so its tangents will be empty.')
+
+                    quantization = None
+                    if self.auto_quantize:
+                        quantization = QuantizationTolerances(self.normal_tolerance, self.weight_tolerance)
+
+                    weights = None
+                    if 'bone_ids' in vertex_dtypes:
+                        weights = self.vertex_weights(mesh, mesh_obj.vertex_groups, coord_indices_dict)
+
+                    # Reuse the encoded mesh if nothing it depends on has changed
+                    cache_key = None
+                    if self.use_mesh_cache:
+                        cache_key = self.mesh_cache_key(
+                            mesh, matrix, weights, vertex_formats, vertex_dtypes, mesh_data.use_triangle_strips, quantization)
+                        cached = ENCODED_MESH_CACHE.get(cache_key)
+                        if cached is not None:
+                            extracted_meshes.append((mesh_obj, mesh_data, EncodedNudMeshes.from_arrays(cached), None))
+                            continue
 
-                if len(faces) > NudMesh.MAX_FACES:
-                    self.operator.report(
-                        {'WARNING'}, f'[NUD MESH] {mesh_obj.name} has {len(faces)} faces (limit is {NudMesh.MAX_FACES}) and will be skipped.')
-                    continue
+                    job = self.extract_mesh(mesh, matrix, weights, vertex_dtypes)
+                    if self.split_large_meshes:
+                        job.max_vertices, job.max_faces = NudMesh.MAX_VERTICES, NudMesh.MAX_FACES
+                    job.optimize_vertex_cache = self.optimize_vertex_cache
+                    job.use_triangle_strips = mesh_data.use_triangle_strips
+                    job.vertex_formats = vertex_formats
+                    job.quantization = quantization
+
+                    extracted_meshes.append((mesh_obj, mesh_data, job, cache_key))
+                finally:
+                    evaluated_obj.to_mesh_clear()
+
+            extracted_models.append((empty, chunk, extracted_meshes))
+
+        # Encode all meshes that were not cached. The results are in the same order as the jobs
+        jobs = [job for _, _, meshes in extracted_models if meshes
+                for _, _, job, _ in meshes if isinstance(job, NudMeshJob)]
+        encoded_meshes = iter(self.encoder.encode(jobs))
+
+        for empty, chunk, extracted_meshes in extracted_models:
+            if extracted_meshes is None:
+                # Existing model from the old clump
+                model_chunks.append(chunk)
+                continue
 
-                mesh_data: NudMeshPropertyGroup = mesh_obj.xfbin_mesh_data
+            mesh_group = chunk.nud.mesh_groups[0]
 
-                nud_mesh = NudMesh()
-                nud_mesh.vertices = vertices
-                nud_mesh.faces = faces
+            # Vertex positions of every exported mesh, for the bounding spheres
+            nud_positions = list()
 
-                # Get the vertex/bone/uv formats from the mesh property group
-                nud_mesh.vertex_type = NudVertexType(int(mesh_data.vertex_type))
-                nud_mesh.bone_type = NudBoneType(int(mesh_data.bone_type))
-                nud_mesh.uv_type = NudUvType(int(mesh_data.uv_type))
-                nud_mesh.face_flag = mesh_data.face_flag
+            for mesh_obj, mesh_data, job, cache_key in extracted_meshes:
+                if isinstance(job, NudMeshJob):
+                    encoded = next(encoded_meshes)
+                    if cache_key:
+                        ENCODED_MESH_CACHE.put(cache_key, encoded.to_arrays())
+                else:
+                    # Cached result
+                    encoded = job
 
-                # Add the material chunk for this mesh
-                mat = xfbin_mats.get(mesh_data.xfbin_material)
-                if mat is None:
-                    self.operator.report(
-                        {'WARNING'}, f'[NUD MESH] {mesh_obj.name} has a non-existing XFBIN material and will be skipped.')
-                    continue
+                self.encoding_stats.update(encoded.stats)
 
-                chunk.material_chunks.append(mat)
+                # Formats chosen by quantization replace the mesh's own formats
+                mesh_formats = (int(mesh_data.vertex_type), int(mesh_data.bone_type), int(mesh_data.uv_type))
+                vertex_type, bone_type, uv_type = encoded.vertex_formats or mesh_formats
+                if encoded.vertex_formats and encoded.vertex_formats != mesh_formats:
+                    self.encoding_stats['quantized_meshes'] += 1
 
-                # Get the material properties of this mesh
-                nud_mesh.materials = self.make_nud_materials(mesh_data, clump, context)
+                parts = encoded.parts
 
-                # Only add the mesh if it doesn't exceed the vertex and face limits
-                mesh_group.meshes.append(nud_mesh)
+                if len(parts) > 1:
+                    self.operator.report(
+                        {'INFO'}, f'[NUD MESH] {mesh_obj.name} exceeds the NUD mesh limits and was split into {len(parts)} meshes.')
+
+                for vertices, faces, face_flag in parts:
+                    if len(vertices) < 3:
+                        self.operator.report(
+                            {'WARNING'}, f'[NUD MESH] {mesh_obj.name} has no valid faces and will be skipped.')
+                        continue
+
+                    if len(vertices) > NudMesh.MAX_VERTICES:
+                        self.operator.report(
+                            {'WARNING'}, f'[NUD MESH] {mesh_obj.name} has {len(vertices)} vertices (limit is {NudMesh.MAX_VERTICES}) and will be skipped.')
+                        continue
+
+                    # The face limit is a limit on the index buffer, where each triangle or strip is followed by a restart index
+                    if strip_index_count(faces) > NudMesh.MAX_FACES * 4:
+                        self.operator.report(
+                            {'WARNING'}, f'[NUD MESH] {mesh_obj.name} has {strip_index_count(faces)} face indices '
+                            f'(limit is {NudMesh.MAX_FACES * 4}) and will be skipped.')
+                        continue
+
+                    nud_mesh = NudMesh()
+                    nud_mesh.vertices = vertices.to_vertices()
+                    nud_mesh.faces = faces
+
+                    # Get the vertex/bone/uv formats from the mesh property group
+                    nud_mesh.vertex_type = NudVertexType(vertex_type)
+                    nud_mesh.bone_type = NudBoneType(bone_type)
+                    nud_mesh.uv_type = NudUvType(uv_type)
+                    nud_mesh.face_flag = mesh_data.face_flag if face_flag is None else face_flag
+
+                    # Add the material chunk for this mesh. Split meshes use the same material and properties for all parts
+                    chunk.material_chunks.append(xfbin_mats.get(mesh_data.xfbin_material))
+
+                    # Get the material properties of this mesh
+                    nud_mesh.materials = self.make_nud_materials(mesh_data, clump, context)
+
+                    # Only add the mesh if it doesn't exceed the vertex and face limits
+                    mesh_group.meshes.append(nud_mesh)
+                    nud_positions.append(vertices['position'])
 
             if not mesh_group.meshes:
                 self.operator.report(
                     {'WARNING'}, f'[NUD] {empty.name} does not contain any exported meshes and will be skipped.')
                 continue
 
+            if self.update_bounding_spheres:
+                # The positions are already in the NUD's units and space. They are the meshes as evaluated in the current pose,
+                # so skinned meshes should be exported in their rest pose for the spheres to enclose the bind pose
+                chunk.nud.bounding_sphere = nud_bounding_sphere(np.concatenate(nud_positions))
+                mesh_group.bounding_sphere = (*chunk.nud.bounding_sphere, *mesh_group.bounding_sphere[4:])
+
             # Only add the model chunk if its NUD contains at least one mesh
             model_chunks.append(chunk)
 
         return model_chunks
 
+    def extract_mesh(self, mesh: Mesh, matrix: Optional[np.ndarray], weights: NudMeshWeights, vertex_dtypes: Dict[str, np.dtype]) -> NudMeshJob:
+        """Pulls the attributes of every triangle corner out of a mesh with foreach_get.
+        Only the attributes that are stored in the mesh's vertex format (vertex_dtypes) are extracted.
+        The positions, normals and tangents are transformed by the 4x4 matrix if one is given, the mesh itself is not modified."""
+
+        use_normals = 'normal' in vertex_dtypes
+        use_tangents = 'tangent' in vertex_dtypes and len(mesh.uv_layers) > 0
+
+        # calc_tangents also calculates the split normals, and fails without UVs
+        if use_tangents:
+            mesh.calc_tangents()
+        elif use_normals:
+            mesh.calc_normals_split()
+        mesh.calc_loop_triangles()
+
+        triangles = mesh.loop_triangles
+        loops = mesh.loops
+
+        # Loop index of each triangle corner
+        tri_loops = np.empty(len(triangles) * 3, dtype=np.int32)
+        triangles.foreach_get('loops', tri_loops)
+
+        loop_vertices = np.empty(len(loops), dtype=np.int32)
+        loops.foreach_get('vertex_index', loop_vertices)
+        tri_vertices = loop_vertices[tri_loops]
+
+        def loop_array(collection, attribute, size):
+            return foreach_get_array(collection, attribute, size)[tri_loops]
+
+        positions = foreach_get_array(mesh.vertices, 'co', 3)
+        if matrix is not None:
+            positions = transform_points(positions, matrix)
+
+        columns = dict()
+
+        # Position and normal, tangent, bitangent
+        columns['position'] = pos_scaled_from_blender_array(positions[tri_vertices])
+        if use_normals:
+            columns['normal'] = loop_array(loops, 'normal', 3)
+            if matrix is not None:
+                columns['normal'] = transform_normals(columns['normal'], matrix)
+
+        if use_tangents:
+            columns['tangent'] = loop_array(loops, 'tangent', 3)
+            if matrix is not None:
+                columns['tangent'] = transform_directions(columns['tangent'], matrix)
+
+            columns['bitangent'] = np.cross(columns['normal'], columns['tangent']) * \
+                loop_array(loops, 'bitangent_sign', 1)[:, None]
+        elif 'tangent' in vertex_dtypes:
+            columns['tangent'] = columns['bitangent'] = np.zeros((len(tri_loops), 3), dtype=np.float32)
+
+        # Free the mesh data after we're done with it
+        if use_tangents:
+            mesh.free_tangents()
+        if use_normals:
+            mesh.free_normals_split()
+
+        # Color
+        if 'color' in vertex_dtypes and len(mesh.vertex_colors):
+            columns['color'] = np.trunc(loop_array(mesh.vertex_colors[0].data, 'color', 4) * 255)
+
+        # UV
+        uvs = [uv_from_blender_array(loop_array(uv_layer.data, 'uv', 2)) for uv_layer in mesh.uv_layers[:2]]
+        if uvs:
+            columns['uv'] = np.stack(uvs, axis=1)
+
+        return NudMeshJob(NudVertexColumns(columns), tri_vertices, vertex_dtypes, weights)
+
+    def mesh_cache_key(self, mesh: Mesh, matrix: Optional[np.ndarray], weights: NudMeshWeights, vertex_formats: Tuple[int, int, int],
+                       vertex_dtypes: Dict[str, np.dtype], use_triangle_strips: bool, quantization: Optional[QuantizationTolerances]) -> str:
+        """Hashes everything the encoding of a mesh depends on: its evaluated geometry, normals, UVs, colors,
+        weights, vertex format, quantization tolerances, face encoding and the bone matrix it is transformed by.
+        The rest of the mesh and NUD properties are rebuilt on every export, so they don't need to be part of the key."""
+
+        # Different formats can have the same dtypes, but still be quantized differently
+        items = [CACHE_VERSION, vertex_formats, sorted((k, v.str) for k, v in vertex_dtypes.items()), matrix, self.split_large_meshes, self.optimize_vertex_cache,
+                 use_triangle_strips, quantization and vars(quantization),
+                 foreach_get_array(mesh.vertices, 'co', 3),
+                 foreach_get_array(mesh.loops, 'vertex_index', 1, np.int32),
+                 foreach_get_array(mesh.polygons, 'loop_start', 1, np.int32)]
+
+        if 'normal' in vertex_dtypes:
+            mesh.calc_normals_split()
+            items.append(foreach_get_array(mesh.loops, 'normal', 3))
+            mesh.free_normals_split()
+
+        if 'color' in vertex_dtypes and len(mesh.vertex_colors):
+            items.append(foreach_get_array(mesh.vertex_colors[0].data, 'color', 4))
+
+        for uv_layer in mesh.uv_layers[:2]:
+            items.append(foreach_get_array(uv_layer.data, 'uv', 2))
+
+        if weights:
+            items.extend((weights.vertex_indices, weights.group_indices, weights.weights, weights.group_to_coord))
+
+        return hash_items(*items)
+
+    def vertex_weights(self, mesh: Mesh, v_groups, coord_indices_dict: Dict[str, int]) -> NudMeshWeights:
+        """Returns the sparse weights of a mesh's vertices. The top 4 bones of each vertex are selected when encoding."""
+
+        # Map each vertex group to its coord index once, instead of looking up its name for every weight
+        group_to_coord = np.array([coord_indices_dict.get(g.name, -1) for g in v_groups], dtype=np.int32)
+
+        # Sparse (vertex, group, weight) list of all weights
+        entries = [(v.index, g.group, g.weight) for v in mesh.vertices for g in v.groups]
+        entries = np.array(entries, dtype=np.float64).reshape(-1, 3)
+
+        return NudMeshWeights(len(mesh.vertices), entries[:, 0].astype(np.int32), entries[:, 1].astype(np.int32),
+                              entries[:, 2].astype(np.float32), group_to_coord)
+
     def make_nud_materials(self, pg: NudMeshPropertyGroup, clump: NuccChunkClump, context) -> List[NudMaterial]:
         materials = list()
 
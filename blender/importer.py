@@ -1,36 +1,176 @@
 import os
-from itertools import chain
-from typing import List
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
 
 import bmesh
 import bpy
+import numpy as np
 from bmesh.types import BMesh
-from bpy.props import BoolProperty, StringProperty
-from bpy.types import Bone, Material, Object, Operator
+from bpy.props import (BoolProperty, CollectionProperty, EnumProperty,
+                       IntProperty, StringProperty)
+from bpy.types import (Bone, Image, Material, Object, Operator,
+                       OperatorFileListElement)
 from bpy_extras.io_utils import ImportHelper
 from mathutils import Matrix, Vector
 
-from ..xfbin_lib.xfbin.structure.nucc import (CoordNode, NuccChunkClump,
-                                              NuccChunkModel, NuccChunkTexture)
+from .. import bl_info
+from ..xfbin_lib.xfbin.structure.nucc import NuccChunkClump, NuccChunkTexture
 from ..xfbin_lib.xfbin.structure.nud import NudMesh
 from ..xfbin_lib.xfbin.structure.xfbin import Xfbin
 from ..xfbin_lib.xfbin.xfbin_reader import read_xfbin
+from .common.bone_matrices import (node_local_matrices, node_world_matrices,
+                                   sort_coord_nodes)
 from .common.coordinate_converter import *
-from .common.helpers import XFBIN_TEXTURES_OBJ
+from .common.helpers import (PYTHON_EXECUTABLE, XFBIN_TEXTURES_OBJ,
+                             foreach_get_array)
+from .common.import_cache import XfbinImportCache, iter_nud_meshes, iter_nuds
+from .common.mesh_cache import hash_items
+from .common.nud_arrays import (NudMeshArrays, bone_arrays, normalize_rows,
+                                transform_normals, weight_buckets)
+from .common.xfbin_loader import LoadedXfbin, XfbinLoader, selected_models
+from .common.xfbin_toc import XfbinToc, XfbinTocCache
 from .panels.clump_panel import XfbinMaterialPropertyGroup
+from .panels.common import BoolPropertyGroup
+
+
+# Custom property of the Meshes that can be shared, storing the hash of their geometry
+GEOMETRY_HASH_PROP = 'xfbin_geometry_hash'
+
+# Tables of contents of the XFBINs previewed in the import dialog, persisted between sessions
+XFBIN_TOC_CACHE: XfbinTocCache = None
+
+
+def get_xfbin_toc(path: str) -> XfbinToc:
+    global XFBIN_TOC_CACHE
+
+    if XFBIN_TOC_CACHE is None:
+        XFBIN_TOC_CACHE = XfbinTocCache(os.path.join(bpy.utils.user_resource('CONFIG'), 'xfbin_toc_cache'))
+
+    return XFBIN_TOC_CACHE.get(path)
+
+
+def save_xfbin_toc_cache():
+    # Called when the import dialog closes, as the dialog is redrawn too often to write the file from draw()
+    if XFBIN_TOC_CACHE is not None:
+        try:
+            XFBIN_TOC_CACHE.save()
+        except OSError as e:
+            # The index is only an optimization, it will be rebuilt next time
+            print(f'Could not save the XFBIN contents index: {e}')
 
 
 class ImportXFBIN(Operator, ImportHelper):
     """Loads an XFBIN file into blender"""
     bl_idname = "import_scene.xfbin"
     bl_label = "Import XFBIN"
+    bl_options = {'REGISTER', 'UNDO'}
 
     use_full_material_names: BoolProperty(
         name="Full material names",
         description="Display full name of materials in NUD meshes, instead of a shortened form")
 
+    use_fast_mesh_build: BoolProperty(
+        name="Fast mesh building",
+        description="Fill the meshes directly from arrays instead of building them vertex by vertex with BMesh.\n"
+        "Disable this only if a model fails to import correctly",
+        default=True)
+
+    decode_workers: IntProperty(
+        name="Worker processes",
+        description="Number of processes that read the files and decode their NUD meshes while blender creates the "
+        "data of the previous ones. Each process loads a different file, so this many files are read in parallel.\n"
+        "Only used when importing several files. 0 reads every file in blender itself",
+        default=2,
+        min=0)
+
+    mesh_instancing: EnumProperty(
+        name="Share meshes",
+        items=[
+            ('NONE', 'Never', 'Create a new mesh for every NUD mesh'),
+            ('IMPORT', 'In this import', 'NUD meshes with identical geometry in the imported XFBIN use the same mesh'),
+            ('FILE', 'In the whole file', 'NUD meshes use the same mesh as any identical one imported before in this .blend'),
+        ],
+        description="Share a single mesh between objects with identical geometry, to save memory and time.\n"
+        "Materials and NUD mesh properties are still set for each object separately.\n"
+        "Only used with fast mesh building",
+        default='IMPORT')
+
+    use_import_transaction: BoolProperty(
+        name="Import as one transaction",
+        description="Link the imported objects to the scene all at once after they are created, "
+        "and don't record any undo steps until the import is finished.\n"
+        "The whole import can still be undone as a single step",
+        default=True)
+
+    use_import_cache: BoolProperty(
+        name="Use import cache",
+        description="Store the decoded meshes of imported XFBINs, and reuse them when the same file is imported again.\n"
+        "The files are still read, only decoding their meshes is skipped. Only used with fast mesh building",
+        default=True)
+
+    import_cache_dir: StringProperty(
+        name="Cache directory",
+        description="Directory of the import cache. If empty, the cache is stored in blender's config directory",
+        subtype='DIR_PATH')
+
+    import_cache_size: IntProperty(
+        name="Cache size (MB)",
+        description="Maximum size of the import cache directory. The least recently imported files are removed first",
+        default=1024,
+        min=1)
+
+    show_contents: BoolProperty(
+        name="Show contents",
+        description="Show the clumps, models and textures of the selected XFBIN",
+        default=True)
+
+    import_specific_models: BoolProperty(
+        name="Import specific models",
+        description="If True, will import only the clumps and models selected in the box below.\n"
+        "The armature and clump properties of the selected clumps are always imported completely.\n"
+        "If False, will import all clumps and models in the XFBIN")
+
+    clumps_to_import: CollectionProperty(
+        type=BoolPropertyGroup,
+    )
+
+    models_to_import: CollectionProperty(
+        type=BoolPropertyGroup,
+    )
+
+    # The file that the clumps and models lists were made for
+    contents_filepath: StringProperty(options={"HIDDEN"})
+
+    files: CollectionProperty(
+        type=OperatorFileListElement,
+        options={'HIDDEN', 'SKIP_SAVE'},
+    )
+
+    directory: StringProperty(subtype='DIR_PATH', options={'HIDDEN', 'SKIP_SAVE'})
+
     filter_glob: StringProperty(default="*.xfbin", options={"HIDDEN"})
 
+    def contents_update(self):
+        self.clumps_to_import.clear()
+        self.models_to_import.clear()
+        self.contents_filepath = self.filepath
+
+        try:
+            toc = get_xfbin_toc(self.filepath)
+        except Exception:
+            return
+
+        for clump in toc.clumps:
+            item = self.clumps_to_import.add()
+            item.name = clump
+            item.value = True
+
+        for model in dict.fromkeys(toc.models):
+            item = self.models_to_import.add()
+            item.name = model
+            item.value = True
+
     def draw(self, context):
         layout = self.layout
 
@@ -38,40 +178,230 @@ class ImportXFBIN(Operator, ImportHelper):
         layout.use_property_decorate = True
 
         layout.prop(self, 'use_full_material_names')
+        layout.prop(self, 'use_import_transaction')
+        layout.prop(self, 'use_fast_mesh_build')
+        if self.use_fast_mesh_build:
+            layout.prop(self, 'decode_workers')
+            layout.prop(self, 'mesh_instancing')
+
+            layout.prop(self, 'use_import_cache')
+            if self.use_import_cache:
+                layout.prop(self, 'import_cache_dir')
+                layout.prop(self, 'import_cache_size')
+
+        layout.prop(self, 'show_contents')
+        if self.show_contents:
+            self.draw_contents(layout)
+
+        # The lists are made from a single file, so they can't be used when importing several files
+        row = layout.row()
+        row.enabled = len(self.files) <= 1
+        row.prop(self, 'import_specific_models')
+        if not row.enabled:
+            layout.label(text='Specific models can only be imported from a single file.', icon='INFO')
+        elif self.import_specific_models:
+            # Update the lists whenever a different file is selected
+            if self.contents_filepath != self.filepath:
+                self.contents_update()
+
+            box = layout.box()
+            if not self.clumps_to_import:
+                box.label(text='No clumps found in the selected file.')
+            else:
+                # Draw a check box for each clump and model to choose which ones should be imported
+                box.label(text='Selected clumps:')
+                for item in self.clumps_to_import:
+                    row = box.split(factor=0.80)
+                    row.label(text=item.name)
+                    row.prop(item, 'value', text='')
 
-    def execute(self, context):
-        import time
+                box.label(text='Selected models:')
+                for item in self.models_to_import:
+                    row = box.split(factor=0.80)
+                    row.label(text=item.name)
+                    row.prop(item, 'value', text='')
+
+    def draw_contents(self, layout):
+        box = layout.box()
+
+        if not (self.filepath.lower().endswith('.xfbin') and os.path.isfile(self.filepath)):
+            box.label(text='No XFBIN file selected.')
+            return
 
+        try:
+            toc = get_xfbin_toc(self.filepath)
+        except Exception as e:
+            box.label(text=f'Could not read the contents: {e}', icon='ERROR')
+            return
+
+        box.label(text=f'{len(toc.pages)} pages, {len(toc.clumps)} clumps, {len(toc.models)} models, {len(toc.textures)} textures')
+
+        for page in toc.pages:
+            for clump in page.clumps:
+                box.label(text=f'{clump} ({len(page.models)} models)', icon='ARMATURE_DATA')
+
+    def cancel(self, context):
+        save_xfbin_toc_cache()
+
+    def execute(self, context):
         # try:
         start_time = time.time()
-        importer = XfbinImporter(self, self.filepath, self.as_keywords(ignore=("filter_glob",)))
+        save_xfbin_toc_cache()
+
+        # Import all selected files, or only the file path if the operator was called without a file list
+        paths = [os.path.join(self.directory, f.name) for f in self.files if f.name] or [self.filepath]
+
+        import_settings = self.as_keywords(ignore=("filter_glob", "contents_filepath", "files", "directory"))
+
+        # The clumps and models lists only apply to the file they were made for
+        if len(paths) > 1 and self.import_specific_models:
+            import_settings['import_specific_models'] = False
+            self.report({'INFO'}, 'Importing all clumps and models, as several files were selected')
+        shared = XfbinImportShared(import_settings)
+        importers = [XfbinImporter(self, path, import_settings, shared) for path in paths]
+
+        # Disable undo while importing, so the intermediate steps are not recorded
+        use_global_undo = context.preferences.edit.use_global_undo
+        if self.use_import_transaction:
+            context.preferences.edit.use_global_undo = False
 
-        importer.read(context)
+        try:
+            self.import_files(importers, context)
+        finally:
+            context.preferences.edit.use_global_undo = use_global_undo
 
         elapsed_s = "{:.2f}s".format(time.time() - start_time)
         print("XFBIN import finished in " + elapsed_s)
 
+        if len(importers) > 1:
+            print("Time per file (read / build):")
+            for importer in importers:
+                print(f'    {os.path.basename(importer.filepath)}: {importer.load_time:.2f}s / {importer.build_time:.2f}s')
+
+            self.report({'INFO'}, f'Imported {len(importers)} files in {elapsed_s}')
+
         return {'FINISHED'}
         # except Exception as error:
         #     print("Catching Error")
         #     self.report({"ERROR"}, str(error))
         # return {'CANCELLED'}
 
+    def import_files(self, importers: List['XfbinImporter'], context):
+        # A single file has nothing to be loaded alongside, and the BMesh path needs the whole file in blender anyway
+        workers = min(self.decode_workers, len(importers)) if len(importers) > 1 and self.use_fast_mesh_build else 0
+        pending = iter(importers)
+        loads = deque()
+
+        with XfbinLoader(workers, PYTHON_EXECUTABLE) as loader:
+            def load_next():
+                importer = next(pending, None)
+                if importer:
+                    loads.append((importer, loader.submit(*importer.load_args())))
+
+            # Load as many files as there are workers in parallel while the current one is built, in the same order they
+            # are imported in. Only that many are loaded ahead, so the parsed files don't all have to fit in memory at once
+            for _ in range(max(1, loader.workers)):
+                load_next()
+
+            while loads:
+                importer, task = loads.popleft()
+                try:
+                    loaded = loader.result(task)
+                except Exception as e:
+                    # Don't let a single broken file stop the rest of the batch
+                    self.report({'WARNING'}, f'Could not read {os.path.basename(importer.filepath)}: {e}')
+                    continue
+                finally:
+                    load_next()
+
+                importer.read(loaded, context)
+
+                # Free the parsed file, as the rest of the batch might still need the memory
+                importer.unload()
+
+            if loader.error is not None:
+                self.report({'WARNING'}, f'Could not load the files in worker processes, they were read in blender instead: {loader.error}')
+
+
+class XfbinImportShared:
+    """Blender data lookups that are shared by all files imported in the same operator run."""
+
+    def __init__(self, import_settings: dict):
+        # Materials keyed by (XFBIN material name, image name)
+        self.materials: Dict[tuple, Material] = dict()
+        self.images: Dict[str, Image] = dict()
+
+        # Meshes that can be reused for identical geometry, keyed by their geometry hash
+        self.meshes: Dict[str, bpy.types.Mesh] = dict()
+        self.created_meshes = set()
+        if import_settings.get("mesh_instancing") == 'FILE':
+            self.meshes = {m[GEOMETRY_HASH_PROP]: m for m in bpy.data.meshes if GEOMETRY_HASH_PROP in m}
+
 
 class XfbinImporter:
-    def __init__(self, operator: Operator, filepath: str, import_settings: dict):
+    def __init__(self, operator: Operator, filepath: str, import_settings: dict, shared: XfbinImportShared = None):
         self.operator = operator
         self.filepath = filepath
-        self.use_full_material_names = import_settings.get("use_full_material_names")
+        self.shared = shared or XfbinImportShared(import_settings)
 
+        self.load_time = self.build_time = 0.0
+        self.use_full_material_names = import_settings.get("use_full_material_names")
+        self.use_fast_mesh_build = import_settings.get("use_fast_mesh_build", True)
+        self.mesh_instancing = import_settings.get("mesh_instancing", 'NONE')
+        self.use_import_transaction = import_settings.get("use_import_transaction", False)
+
+        self.import_cache = None
+        if self.use_fast_mesh_build and import_settings.get("use_import_cache"):
+            cache_dir = bpy.path.abspath(import_settings.get("import_cache_dir") or '') or os.path.join(
+                bpy.utils.user_resource('CONFIG'), 'xfbin_import_cache')
+            self.import_cache = XfbinImportCache(cache_dir, import_settings.get("import_cache_size", 1024) * 1024 * 1024)
+
+        # None means everything will be imported
+        self.clumps_to_import = self.models_to_import = None
+        if import_settings.get("import_specific_models"):
+            self.clumps_to_import = {i.name for i in import_settings.get("clumps_to_import") if i.value}
+            self.models_to_import = {i.name for i in import_settings.get("models_to_import") if i.value}
+
+    loaded: LoadedXfbin
     xfbin: Xfbin
     collection: bpy.types.Collection
 
-    def read(self, context):
-        self.xfbin = read_xfbin(self.filepath)
+    # Indices of the NudMeshes and NUDs in the loaded file, keyed by their ids
+    mesh_indices: Dict[int, int]
+    nud_indices: Dict[int, int]
+
+    # Meshes of the file read again in blender, if the loaded file's geometry was stripped and is needed for BMesh
+    source_meshes: Optional[List[NudMesh]]
+
+    def load_args(self) -> tuple:
+        """Returns the arguments of load_xfbin for this file, except strip_geometry."""
+
+        return (self.filepath, self.use_fast_mesh_build, self.clumps_to_import, self.models_to_import,
+                self.import_cache, bl_info['version'])
+
+    def read(self, loaded: LoadedXfbin, context):
+        """Imports the XFBIN that was loaded with load_xfbin."""
+
+        start_time = time.perf_counter()
+
+        self.loaded = loaded
+        self.xfbin = loaded.xfbin
+        self.load_time = loaded.load_time
+        self.source_meshes = None
+
+        # Index the meshes before any chunk is cleared, so they match the indices of the loaded file
+        self.mesh_indices = {id(m): i for i, m in enumerate(iter_nud_meshes(self.xfbin))}
+        self.nud_indices = {id(n): i for i, n in enumerate(iter_nuds(self.xfbin))}
+
+        if loaded.cache_error is not None:
+            # The file itself was loaded, so only report the cache failure
+            self.operator.report({'WARNING'}, f'Could not save the import cache: {loaded.cache_error}')
+
         self.collection = self.make_collection(context)
+        self.unlinked_objects: List[Object] = list()
 
         texture_chunks: List[NuccChunkTexture] = list()
+        clumps: List[Tuple[NuccChunkClump, Object]] = list()
 
         for page in self.xfbin.pages:
             # Add all texture chunks inside the xfbin
@@ -84,31 +414,71 @@ class XfbinImporter:
 
             clump: NuccChunkClump = clump[0]
 
+            if self.clumps_to_import is not None and clump.name not in self.clumps_to_import:
+                continue
+
             # Clear unsupported chunks to avoid issues
             if clump.clear_non_model_chunks() > 0:
                 self.operator.report(
                     {'WARNING'}, f'Some chunks in {clump.name} have unsupported types and will not be imported')
 
-            armature_obj = self.make_armature(clump, context)
-            self.make_objects(clump, armature_obj, context)
+            clumps.append((clump, self.make_armature(clump, context)))
 
-            # Set the armature as the active object after importing everything
-            bpy.ops.object.mode_set(mode='OBJECT')
-            context.view_layer.objects.active = armature_obj
+        # Create the bones of all armatures in a single edit mode session
+        self.make_bones(clumps, context)
+
+        for clump, armature_obj in clumps:
+            self.make_objects(clump, armature_obj, context)
 
             # Update the models' PointerProperty to use the models that were just imported
             armature_obj.xfbin_clump_data.update_models(armature_obj)
 
+        # Set the last armature as the active object after importing everything
+        if clumps:
+            context.view_layer.objects.active = clumps[-1][1]
+
         # Create an empty object to store the texture chunks list
         empty = bpy.data.objects.new(f'{XFBIN_TEXTURES_OBJ} [{self.collection.name}]', None)
         empty.empty_display_size = 0
 
         # Link the empty to the collection
-        self.collection.objects.link(empty)
+        self.link_object(empty)
 
         # Add the found texture chunks to the empty object
         empty.xfbin_texture_chunks_data.init_data(texture_chunks)
 
+        # Link everything that was created unlinked in one go
+        for obj in self.unlinked_objects:
+            self.collection.objects.link(obj)
+        self.unlinked_objects = list()
+
+        self.build_time = time.perf_counter() - start_time
+
+    def link_object(self, obj: Object):
+        """Links an object to the collection, or defers it to the end of the import in transaction mode.
+        Armatures are always linked immediately, as they have to be in the scene to enter edit mode."""
+
+        if self.use_import_transaction:
+            self.unlinked_objects.append(obj)
+        else:
+            self.collection.objects.link(obj)
+
+    def unload(self):
+        self.loaded = self.xfbin = None
+        self.mesh_indices = self.nud_indices = dict()
+        self.source_meshes = None
+
+    def source_mesh(self, mesh: NudMesh) -> NudMesh:
+        """Returns the NUD mesh with its vertices and faces, reading the file again if they were stripped by the worker."""
+
+        if not self.loaded.stripped:
+            return mesh
+
+        if self.source_meshes is None:
+            self.source_meshes = list(iter_nud_meshes(read_xfbin(self.filepath)))
+
+        return self.source_meshes[self.mesh_indices[id(mesh)]]
+
     def make_collection(self, context) -> bpy.types.Collection:
         """
         Build a collection to hold all of the objects and meshes from the GMDScene.
@@ -136,65 +506,62 @@ class XfbinImporter:
 
         self.collection.objects.link(armature_obj)
 
-        context.view_layer.objects.active = armature_obj
-        bpy.ops.object.mode_set(mode='EDIT')
-
-        bone_matrices = dict()
+        return armature_obj
 
-        def make_bone(node: CoordNode):
+    def make_bones(self, clumps: List[Tuple[NuccChunkClump, Object]], context):
+        """Creates the bones of every clump's armature. All armatures are edited together, so edit mode is entered only once."""
 
-            # Find the local->world matrix for the parent bone, and use this to find the local->world matrix for the current bone
-            if node.parent:
-                parent_matrix = bone_matrices[node.parent.name]
-            else:
-                parent_matrix = Matrix.Identity(4)
+        if not clumps:
+            return
 
-            # Convert the node values
-            pos = pos_cm_to_m(node.position)
-            rot = rot_to_blender(node.rotation)
-            sca = Vector(tuple(map(lambda x: abs(x), node.scale)))  # Absolute value of the scale
+        # Only the new armatures should enter edit mode
+        selected_objects = list(context.view_layer.objects.selected)
+        for obj in selected_objects:
+            obj.select_set(False)
 
-            # Set up the transformation matrix
-            this_bone_matrix = parent_matrix @ (Matrix.Translation(pos) @
-                                                rot.to_matrix().to_4x4() @ Matrix.Diagonal(sca).to_4x4())
+        for _, armature_obj in clumps:
+            armature_obj.select_set(True)
 
-            # Add the matrix to the dictionary
-            bone_matrices[node.name] = this_bone_matrix
+        context.view_layer.objects.active = clumps[0][1]
+        bpy.ops.object.mode_set(mode='EDIT')
 
-            bone = armature.edit_bones.new(node.name)
-            bone.use_relative_parent = False
-            bone.use_deform = True
+        for clump, armature_obj in clumps:
+            edit_bones = armature_obj.data.edit_bones
 
-            # Having a long tail would offset the meshes parented to the mesh bones, so we avoid that for now
-            bone.tail = Vector((0, 0.0001, 0))
+            # Parents come before their children, so every parent bone exists before it is referenced
+            nodes, parents = sort_coord_nodes(clump.root_nodes)
+            world_matrices = node_world_matrices(node_local_matrices(nodes), parents)
 
-            bone.matrix = this_bone_matrix
-            bone.parent = armature.edit_bones[node.parent.name] if node.parent else None
+            bones = list()
+            for node, parent, matrix in zip(nodes, parents.tolist(), world_matrices.tolist()):
+                bone = edit_bones.new(node.name)
+                bone.use_relative_parent = False
+                bone.use_deform = True
 
-            # Store the signs of the node's scale to apply when exporting, as applying them here (if negative) will break the rotation
-            bone['scale_signs'] = tuple(map(lambda x: -1 if x < 0 else 1, node.scale))
+                # Having a long tail would offset the meshes parented to the mesh bones, so we avoid that for now
+                bone.tail = Vector((0, 0.0001, 0))
 
-            # Store these unknown values to set when exporting
-            bone['unk_float'] = node.unkFloat
-            bone['unk_short'] = node.unkShort
+                bone.matrix = Matrix(matrix)
+                bone.parent = bones[parent] if parent >= 0 else None
+                bones.append(bone)
 
-            for child in node.children:
-                make_bone(child)
+                # Store the signs of the node's scale to apply when exporting, as applying them here (if negative) will break the rotation
+                bone['scale_signs'] = tuple(map(lambda x: -1 if x < 0 else 1, node.scale))
 
-        for root in clump.root_nodes:
-            make_bone(root)
+                # Store these unknown values to set when exporting
+                bone['unk_float'] = node.unkFloat
+                bone['unk_short'] = node.unkShort
 
         bpy.ops.object.mode_set(mode='OBJECT')
 
-        return armature_obj
+        # Restore the selection
+        for _, armature_obj in clumps:
+            armature_obj.select_set(False)
 
-    def make_objects(self, clump: NuccChunkClump, armature_obj: Object, context):
-        vertex_group_list = [coord.node.name for coord in clump.coord_chunks]
-        vertex_group_indices = {
-            name: i
-            for i, name in enumerate(vertex_group_list)
-        }
+        for obj in selected_objects:
+            obj.select_set(True)
 
+    def make_objects(self, clump: NuccChunkClump, armature_obj: Object, context):
         # Small QoL fix for JoJo "_f" models to show shortened material names
         clump_name = clump.name
         if clump_name.endswith('_f'):
@@ -206,13 +573,7 @@ class XfbinImporter:
             for name, mat in map(lambda x: (x.name, self.make_material(x)), armature_obj.xfbin_clump_data.materials)
         }
 
-        all_model_chunks = list(dict.fromkeys(
-            chain(clump.model_chunks, *map(lambda x: x.model_chunks, clump.model_groups))))
-
-        for nucc_model in all_model_chunks:
-            if not (isinstance(nucc_model, NuccChunkModel) and nucc_model.nud):
-                continue
-
+        for nucc_model in selected_models(clump, self.models_to_import):
             nud = nucc_model.nud
 
             # Create an empty to store the NUD's properties, and set the armature to be its parent
@@ -221,13 +582,13 @@ class XfbinImporter:
             empty.parent = armature_obj
 
             # Link the empty to the collection
-            self.collection.objects.link(empty)
+            self.link_object(empty)
 
             # Set the NUD properties
             empty.xfbin_nud_data.init_data(nucc_model, nucc_model.coord_chunk.name if nucc_model.coord_chunk else None)
 
-            # Get the bone range that this NUD uses
-            bone_range = nud.get_bone_range()
+            # Get the bone range that this NUD uses. It was computed when the file was loaded, as the vertices might be stripped
+            bone_range = self.loaded.bone_ranges[self.nud_indices[id(nud)]]
 
             # Set the mesh bone as the empty's parent bone, if it exists (it should)
             mesh_bone = None
@@ -252,82 +613,265 @@ class XfbinImporter:
                     # The order of the mesh might matter, so the index is added here regardless
                     mesh_name = f'{group.name} ({i+1}) [{mat_name}]' if len(mat_name) else group.name
 
-                    overall_mesh = bpy.data.meshes.new(mesh_name)
+                    material = xfbin_material_dict.get(mat_chunk.name)
 
-                    # This list will get filled in nud_mesh_to_bmesh
-                    custom_normals = list()
-                    new_bmesh = self.nud_mesh_to_bmesh(mesh, clump, vertex_group_indices, custom_normals)
-
-                    # Convert the BMesh to a blender Mesh
-                    new_bmesh.to_mesh(overall_mesh)
-                    new_bmesh.free()
-
-                    # Use the custom normals we made eariler
-                    overall_mesh.create_normals_split()
-                    overall_mesh.normals_split_custom_set_from_vertices(custom_normals)
-                    overall_mesh.auto_smooth_angle = 0
-                    overall_mesh.use_auto_smooth = True
-
-                    # If we're not going to parent it, transform the mesh by the bone's matrix
+                    # If we're not going to parent it, the mesh will be transformed by the bone's matrix
+                    bone_matrix = None
                     if mesh_bone and bone_range != (0, 0):
-                        overall_mesh.transform(mesh_bone.matrix_local.to_4x4())
-
-                    # Add the xfbin material to the mesh
-                    overall_mesh.materials.append(xfbin_material_dict.get(mat_chunk.name))
+                        bone_matrix = mesh_bone.matrix_local.to_4x4()
+
+                    mesh_index = self.mesh_indices[id(mesh)]
+                    mesh_arrays = self.loaded.mesh_arrays.get(mesh_index)
+                    if mesh_index in self.loaded.decode_errors:
+                        self.operator.report(
+                            {'WARNING'}, f'Decoding failed for {mesh_name}, it will be built with BMesh instead: '
+                            f'{self.loaded.decode_errors[mesh_index]}')
+
+                    # Reuse the Mesh of an identical NUD mesh if there is one
+                    overall_mesh = geometry_key = None
+                    if mesh_arrays is not None and self.mesh_instancing != 'NONE':
+                        geometry_key = self.geometry_key(mesh_arrays, bone_matrix)
+                        overall_mesh = self.find_shared_mesh(geometry_key, mesh_arrays, bone_matrix)
+
+                    is_shared = overall_mesh is not None
+                    if not is_shared:
+                        overall_mesh = bpy.data.meshes.new(mesh_name)
+                        mesh_arrays = self.build_mesh(overall_mesh, mesh, mesh_arrays, bone_matrix)
+
+                        # Add the xfbin material to the mesh
+                        overall_mesh.materials.append(material)
+
+                        if geometry_key and mesh_arrays is not None:
+                            overall_mesh[GEOMETRY_HASH_PROP] = geometry_key
+                            self.shared.meshes[geometry_key] = overall_mesh
+                            self.shared.created_meshes.add(geometry_key)
 
                     mesh_obj: bpy.types.Object = bpy.data.objects.new(mesh_name, overall_mesh)
 
+                    # The Mesh is shared, so a different material has to be linked to the object instead
+                    if is_shared and mesh_obj.material_slots and mesh_obj.material_slots[0].material != material:
+                        mesh_obj.material_slots[0].link = 'OBJECT'
+                        mesh_obj.material_slots[0].material = material
+
                     # Link the mesh object to the collection
-                    self.collection.objects.link(mesh_obj)
+                    self.link_object(mesh_obj)
 
                     # Parent the mesh to the empty
                     mesh_obj.parent = empty
 
-                    # Set the mesh as the active object to properly initialize its PropertyGroup
-                    context.view_layer.objects.active = mesh_obj
-
                     # Set the NUD mesh properties
                     mesh_obj.xfbin_mesh_data.init_data(mesh, mat_chunk.name)
 
-                    # Create the vertex groups for all bones (required)
-                    for name in [coord.node.name for coord in clump.coord_chunks]:
-                        mesh_obj.vertex_groups.new(name=name)
+                    # Create the vertex groups of the bones this mesh uses, and add their weights
+                    if mesh_arrays is not None:
+                        mesh_weights = mesh_arrays.weight_buckets
+                    else:
+                        mesh_weights = weight_buckets(*bone_arrays(self.source_mesh(mesh)))
+
+                    self.add_vertex_weights(mesh_obj, clump, mesh_weights)
 
                     # Apply the armature modifier
                     modifier = mesh_obj.modifiers.new(type='ARMATURE', name="Armature")
                     modifier.object = armature_obj
 
-    def make_material(self, xfbin_mat: XfbinMaterialPropertyGroup) -> Material:
-        material: Material = bpy.data.materials.new(f'[XFBIN] {xfbin_mat.name}')
+    def build_mesh(self, overall_mesh: bpy.types.Mesh, mesh: NudMesh, mesh_arrays: NudMeshArrays, bone_matrix: Matrix) -> NudMeshArrays:
+        """Fills an empty blender Mesh from a NUD mesh, using its arrays if they were decoded.
+        Returns the arrays, or None if the BMesh path had to be used."""
+
+        if mesh_arrays is not None:
+            try:
+                self.nud_mesh_to_mesh(mesh_arrays, overall_mesh)
+            except Exception as e:
+                # Fall back to the BMesh path for anything the arrays could not handle
+                self.operator.report(
+                    {'WARNING'}, f'Fast mesh building failed for {overall_mesh.name}, it will be built with BMesh instead: {e}')
+                overall_mesh.clear_geometry()
+                mesh_arrays = None
+
+        if mesh_arrays is None:
+            # This list will get filled in nud_mesh_to_bmesh
+            custom_normals = list()
+            new_bmesh = self.nud_mesh_to_bmesh(self.source_mesh(mesh), custom_normals)
+
+            # Convert the BMesh to a blender Mesh
+            new_bmesh.to_mesh(overall_mesh)
+            new_bmesh.free()
+        else:
+            custom_normals = mesh_arrays.normals
+
+        # Use the custom normals we made eariler
+        if custom_normals is not None and len(custom_normals):
+            overall_mesh.create_normals_split()
+            overall_mesh.normals_split_custom_set_from_vertices(custom_normals)
+        overall_mesh.auto_smooth_angle = 0
+        overall_mesh.use_auto_smooth = True
+
+        if bone_matrix is not None:
+            overall_mesh.transform(bone_matrix)
+
+        return mesh_arrays
+
+    def geometry_key(self, mesh_arrays: NudMeshArrays, bone_matrix: Matrix) -> str:
+        """Hashes everything that ends up in a Mesh built from the arrays. Weights are not included, as they belong to the object."""
+
+        matrix = np.array(bone_matrix, dtype=np.float32) if bone_matrix is not None else None
+        return hash_items(mesh_arrays.positions, mesh_arrays.faces, mesh_arrays.normals, mesh_arrays.colors,
+                          len(mesh_arrays.uvs), *mesh_arrays.uvs, matrix)
+
+    def find_shared_mesh(self, geometry_key: str, mesh_arrays: NudMeshArrays, bone_matrix: Matrix):
+        mesh = self.shared.meshes.get(geometry_key)
+        if mesh is None or geometry_key in self.shared.created_meshes:
+            return mesh
+
+        # Meshes from previous imports might have been edited since, so check that they still match the arrays
+        if not self.mesh_matches_arrays(mesh, mesh_arrays, bone_matrix):
+            return None
+
+        # Don't check the same mesh again for the rest of the import
+        self.shared.created_meshes.add(geometry_key)
+        return mesh
+
+    def mesh_matches_arrays(self, mesh: bpy.types.Mesh, mesh_arrays: NudMeshArrays, bone_matrix: Matrix) -> bool:
+        """Compares everything that build_mesh would create from the arrays with an existing Mesh."""
+
+        loop_vertices = mesh_arrays.loop_vertices
+        if (len(mesh.vertices) != mesh_arrays.vertex_count or len(mesh.polygons) != len(mesh_arrays.faces)
+                or len(mesh.loops) != len(loop_vertices)):
+            return False
+
+        matrix = np.array(bone_matrix, dtype=np.float32) if bone_matrix is not None else None
 
+        positions = mesh_arrays.positions
+        if matrix is not None:
+            positions = positions @ matrix[:3, :3].T + matrix[:3, 3]
+
+        if not np.allclose(foreach_get_array(mesh.vertices, 'co', 3), positions, atol=1e-5):
+            return False
+
+        # The faces are all triangles, so comparing the loops compares the faces as well
+        if not np.array_equal(foreach_get_array(mesh.loops, 'vertex_index', dtype=np.int32), loop_vertices):
+            return False
+
+        if len(mesh.uv_layers) != len(mesh_arrays.uvs):
+            return False
+
+        for uv_layer, uv in zip(mesh.uv_layers, mesh_arrays.uvs):
+            if not np.allclose(foreach_get_array(uv_layer.data, 'uv', 2), uv[loop_vertices], atol=1e-5):
+                return False
+
+        if (mesh_arrays.colors is not None) != bool(len(mesh.vertex_colors)):
+            return False
+
+        # Vertex colors are stored as bytes
+        if mesh_arrays.colors is not None and not np.allclose(
+                foreach_get_array(mesh.vertex_colors[0].data, 'color', 4), mesh_arrays.colors[loop_vertices], atol=1 / 255):
+            return False
+
+        normals = mesh_arrays.normals
+        has_normals = normals is not None and len(normals) > 0
+        if has_normals != mesh.has_custom_normals:
+            return False
+
+        if has_normals:
+            if matrix is not None:
+                normals = transform_normals(normals, matrix)
+
+            # Custom normals are stored compressed, so they only match approximately
+            mesh.calc_normals_split()
+            loop_normals = foreach_get_array(mesh.loops, 'normal', 3)
+            mesh.free_normals_split()
+
+            if not np.allclose(loop_normals, normalize_rows(normals[loop_vertices]), atol=1e-3):
+                return False
+
+        return True
+
+    def make_material(self, xfbin_mat: XfbinMaterialPropertyGroup) -> Material:
+        image_name = None
         if xfbin_mat.texture_groups and xfbin_mat.texture_groups[0].textures:
             image_name = xfbin_mat.texture_groups[0].textures[0].texture
 
+        # Materials with the same name and texture are shared by all files in the import
+        material = self.shared.materials.get((xfbin_mat.name, image_name))
+        if material is not None:
+            return material
+
+        material: Material = bpy.data.materials.new(f'[XFBIN] {xfbin_mat.name}')
+        self.shared.materials[(xfbin_mat.name, image_name)] = material
+
+        if image_name is not None:
             material.use_nodes = True
             bsdf_node = material.node_tree.nodes.get('Principled BSDF')
 
-            image_node = material.node_tree.nodes.new('ShaderNodeTexImage')
-            image_node.location = (-300, 220)
+            image = self.find_image(image_name)
+            if image is not None:
+                # If the image exists, link it to the material
+                image_node = material.node_tree.nodes.new('ShaderNodeTexImage')
+                image_node.location = (-300, 220)
+                image_node.image = image
+
+                material.node_tree.links.new(image_node.outputs['Color'], bsdf_node.inputs['Base Color'])
 
-            # Try different name variations because blender loads external images with their extension
-            for name in (image_name, f'{image_name}.dds', f'{image_name}.png'):
-                image_node.image = bpy.data.images.get(name)
+        return material
 
-                if image_node.image is not None:
-                    # If the image exists, link it to the material
-                    material.node_tree.links.new(image_node.outputs['Color'], bsdf_node.inputs['Base Color'])
-                    break
+    def find_image(self, image_name: str) -> Image:
+        if image_name in self.shared.images:
+            return self.shared.images[image_name]
 
-            # Remove the image node if we couldn't find the texture
-            if image_node.image is None:
-                material.node_tree.nodes.remove(image_node)
+        # Try different name variations because blender loads external images with their extension
+        image = None
+        for name in (image_name, f'{image_name}.dds', f'{image_name}.png'):
+            image = bpy.data.images.get(name)
+            if image is not None:
+                break
 
-        return material
+        self.shared.images[image_name] = image
+        return image
 
-    def nud_mesh_to_bmesh(self, mesh: NudMesh, clump: NuccChunkClump, vertex_group_indices, custom_normals) -> BMesh:
-        bm = bmesh.new()
+    def add_vertex_weights(self, mesh_obj: Object, clump: NuccChunkClump, mesh_weights):
+        """Creates only the vertex groups that are referenced by the weights, and adds the weights
+        with a single VertexGroup.add call for each bone and weight value."""
+
+        vertex_groups = mesh_obj.vertex_groups
+        for bone_id, buckets in mesh_weights:
+            name = clump.coord_chunks[bone_id].node.name
+            vertex_group = vertex_groups.get(name) or vertex_groups.new(name=name)
+
+            for weight, indices in buckets:
+                vertex_group.add(indices.tolist(), weight, 'REPLACE')
+
+    def nud_mesh_to_mesh(self, arrays: NudMeshArrays, mesh: bpy.types.Mesh):
+        """Fills an empty blender Mesh from the arrays of a NUD mesh using foreach_set."""
+
+        faces = arrays.faces
+        face_count = len(faces)
+        loop_vertices = arrays.loop_vertices
+
+        mesh.vertices.add(arrays.vertex_count)
+        mesh.vertices.foreach_set('co', arrays.positions.ravel())
+
+        mesh.loops.add(len(loop_vertices))
+        mesh.loops.foreach_set('vertex_index', loop_vertices)
 
-        deform = bm.verts.layers.deform.new("Vertex Weights")
+        mesh.polygons.add(face_count)
+        mesh.polygons.foreach_set('loop_start', np.arange(0, face_count * 3, 3, dtype=np.int32))
+        mesh.polygons.foreach_set('loop_total', np.full(face_count, 3, dtype=np.int32))
+        mesh.polygons.foreach_set('use_smooth', np.ones(face_count, dtype=bool))
+
+        mesh.update(calc_edges=True)
+
+        # Color
+        if arrays.colors is not None:
+            col_layer = mesh.vertex_colors.new(name="Color")
+            col_layer.data.foreach_set('color', arrays.colors[loop_vertices].ravel())
+
+        # UVs
+        for i, uv in enumerate(arrays.uvs):
+            uv_layer = mesh.uv_layers.new(name=f"UV_{i}")
+            uv_layer.data.foreach_set('uv', uv[loop_vertices].ravel())
+
+    def nud_mesh_to_bmesh(self, mesh: NudMesh, custom_normals) -> BMesh:
+        bm = bmesh.new()
 
         # Vertices
         for i in range(len(mesh.vertices)):
@@ -340,12 +884,6 @@ class XfbinImporter:
                 custom_normals.append(normal)
                 vert.normal = normal
 
-            if vtx.bone_weights:
-                for bone_id, bone_weight in zip(vtx.bone_ids, vtx.bone_weights):
-                    if bone_weight > 0:
-                        vertex_group_index = vertex_group_indices[clump.coord_chunks[bone_id].name]
-                        vert[deform][vertex_group_index] = bone_weight
-
         # Set up the indexing table inside the bmesh so lookups work
         bm.verts.ensure_lookup_table()
         bm.verts.index_update()
@@ -1,6 +1,6 @@
 import bpy
-from bpy.props import (CollectionProperty, EnumProperty, FloatProperty,
-                       IntProperty, StringProperty)
+from bpy.props import (BoolProperty, CollectionProperty, EnumProperty,
+                       FloatProperty, IntProperty, StringProperty)
 from bpy.types import Panel, PropertyGroup
 
 from ...xfbin_lib.xfbin.structure.nud import (NudMaterial, NudMaterialProperty,
@@ -237,7 +237,12 @@ class NudMeshPropertyGroup(PropertyGroup):
     """Property group that contains attributes of a nuccChunkModel."""
 
     def update_xfbin_material(self, context):
-        xfbin_mat = context.object.parent.parent.xfbin_clump_data.materials.get(self.xfbin_material)
+        # Use the object that owns this property group, which is not necessarily the active object
+        obj = self.id_data
+        if not (obj.parent and obj.parent.parent):
+            return
+
+        xfbin_mat = obj.parent.parent.xfbin_clump_data.materials.get(self.xfbin_material)
 
         if not (xfbin_mat and xfbin_mat.texture_groups):
             return
@@ -296,6 +301,15 @@ class NudMeshPropertyGroup(PropertyGroup):
         default=0x04,
     )
 
+    use_triangle_strips: BoolProperty(
+        name='Triangle Strips',
+        description='Join the faces into long triangle strips instead of writing each triangle separately, '
+        'which makes the index buffer smaller.\n'
+        'The face flag is set to triangle strips (0x04) automatically. Meshes that would not get smaller keep separate triangles.\n'
+        'Building the strips is slow for large meshes, so this is off by default',
+        default=False,
+    )
+
     xfbin_material: StringProperty(
         name='XFBIN Material',
         description='The XFBIN material that this mesh uses',
@@ -479,6 +493,7 @@ class NudMeshPropertyPanel(Panel):
         layout.prop(data, 'bone_type')
         layout.prop(data, 'uv_type')
         layout.prop(data, 'face_flag')
+        layout.prop(data, 'use_triangle_strips')
 
         layout.prop_search(data, 'xfbin_material', clump_data, 'materials')
 
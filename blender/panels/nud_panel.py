@@ -1,10 +1,14 @@
 import bpy
+import numpy as np
 from bpy.props import (EnumProperty, FloatVectorProperty, IntProperty,
                        IntVectorProperty, StringProperty)
-from bpy.types import Panel, PropertyGroup
+from bpy.types import Object, Operator, Panel, PropertyGroup
 
 from ...xfbin_lib.xfbin.structure.nucc import NuccChunkModel, RiggingFlag
+from ..common.bounding_spheres import nud_bounding_sphere
 from ..common.coordinate_converter import pos_cm_to_m_tuple
+from ..common.helpers import foreach_get_array
+from ..common.nud_arrays import transform_points
 from .common import draw_copy_paste_ops, matrix_prop
 
 
@@ -111,6 +115,66 @@ class NudPropertyGroup(PropertyGroup):
         self.bounding_sphere_nud = pos_cm_to_m_tuple(tuple(model.nud.bounding_sphere))
 
 
+def is_nud_empty(obj: Object) -> bool:
+    return obj is not None and obj.type == 'EMPTY' and obj.parent is not None and obj.parent.type == 'ARMATURE'
+
+
+class XFBIN_PANEL_OT_UpdateBoundingSpheres(Operator):
+    """Compute the bounding spheres of the selected NUDs from their meshes, in the armature's rest pose"""
+
+    bl_idname = 'xfbin_panel.update_bounding_spheres'
+    bl_label = 'Update Bounding Spheres'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        return is_nud_empty(context.object) or any(map(is_nud_empty, context.selected_objects))
+
+    def execute(self, context):
+        empties = {obj for obj in (context.object, *context.selected_objects) if is_nud_empty(obj)}
+        armatures = {empty.parent for empty in empties}
+
+        # The exported vertices of skinned meshes are their bind pose, so evaluate the meshes in the rest pose
+        pose_positions = {armature: armature.data.pose_position for armature in armatures}
+        try:
+            for armature in armatures:
+                armature.data.pose_position = 'REST'
+
+            depsgraph = context.evaluated_depsgraph_get()
+
+            for empty in empties:
+                meshes = [c for c in empty.children if c.type == 'MESH']
+                points = np.concatenate([self.mesh_positions(empty, m, depsgraph) for m in meshes] or [np.zeros((0, 3))])
+
+                data: NudPropertyGroup = empty.xfbin_nud_data
+                data.bounding_sphere_nud = nud_bounding_sphere(points)
+                data.bounding_sphere_group = (*data.bounding_sphere_nud, *data.bounding_sphere_group[4:])
+        finally:
+            for armature, pose_position in pose_positions.items():
+                armature.data.pose_position = pose_position
+
+        self.report({'INFO'}, f'Updated the bounding spheres of {len(empties)} NUD(s)')
+        return {'FINISHED'}
+
+    def mesh_positions(self, empty: Object, mesh_obj: Object, depsgraph) -> np.ndarray:
+        """Returns the positions of the vertices used by the evaluated mesh's faces, in the same space as the exporter writes them."""
+
+        evaluated_obj = mesh_obj.evaluated_get(depsgraph)
+        mesh = evaluated_obj.to_mesh()
+        try:
+            positions = foreach_get_array(mesh.vertices, 'co', 3)
+            positions = positions[np.unique(foreach_get_array(mesh.loops, 'vertex_index', 1, np.int32))]
+        finally:
+            evaluated_obj.to_mesh_clear()
+
+        # Same as the exporter: the vertices are relative to the mesh bone, unless the NUD is parented to it
+        mesh_bone = empty.parent.data.bones.get(empty.xfbin_nud_data.mesh_bone)
+        if mesh_bone and empty.parent_type != 'BONE':
+            positions = transform_points(positions, np.array(mesh_bone.matrix_local.to_4x4().inverted(), dtype=np.float32))
+
+        return positions
+
+
 class NudPropertyPanel(Panel):
     """Panel that displays the NudPropertyGroup attached to the selected empty object."""
 
@@ -149,6 +213,7 @@ class NudPropertyPanel(Panel):
 
         matrix_prop(layout, data, 'bounding_sphere_nud', 4, 'Bounding Sphere (NUD)')
         matrix_prop(layout, data, 'bounding_sphere_group', 8, 'Bounding Sphere (Group)')
+        layout.operator(XFBIN_PANEL_OT_UpdateBoundingSpheres.bl_idname)
 
 
 nud_property_groups = (
@@ -157,5 +222,6 @@ nud_property_groups = (
 
 nud_classes = (
     *nud_property_groups,
+    XFBIN_PANEL_OT_UpdateBoundingSpheres,
     NudPropertyPanel,
 )